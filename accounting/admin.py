@@ -1,4 +1,4 @@
-# Copyright (c) 2015-2022 Data King Ltd
+# Copyright (c) 2015-2026 Data King Ltd
 # See LICENSE file for license details
 
 from django.contrib import admin, messages
@@ -76,8 +76,16 @@ class AccountAdmin(ContextMixin, MPTTModelAdmin):
         Account.get_balance_display
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_balances(
+            (None,), children=True
+        )
+
     def get_context(self, account):
-        return {'transactions': account.transactions, 'account': account}
+        return {
+            'transactions': account.transactions.with_items(),
+            'account': account
+        }
 
 admin.site.register(Account, AccountAdmin)
 
@@ -86,9 +94,14 @@ class LotAdmin(ContextAdmin):
     model = Lot
     list_display = (Lot.__str__, 'account', Lot.get_balance_display)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_balances()
+
     def get_context(self, lot):
         return {
-            'transactions': lot.transactions, 'account': lot.account, 'lot': lot
+            'transactions': lot.transactions.with_items(),
+            'account': lot.account,
+            'lot': lot
         }
 
 admin.site.register(Lot, LotAdmin)
@@ -100,7 +113,7 @@ class JournalAdmin(ContextAdmin):
     change_form_template = 'accounting/transaction_list.html'
 
     def get_context(self, journal):
-        return {'transactions': journal.transactions}
+        return {'transactions': journal.transactions.with_items()}
 
 admin.site.register(Journal, JournalAdmin)
 
@@ -108,6 +121,7 @@ admin.site.register(Journal, JournalAdmin)
 class TransactionItemInline(admin.TabularInline):
     model = TransactionItem
     form = TransactionItemForm
+    formset = TransactionItemFormSet
 
 class TransactionAdmin(ContextAdmin):
     model = Transaction
@@ -123,6 +137,9 @@ class TransactionAdmin(ContextAdmin):
         ),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_balances()
+
     def get_context(self, txn):
         return {
             'transactions': [txn], 'title': txn
@@ -1,16 +1,68 @@
-# Copyright (c) 2015-2022 Data King Ltd
+# Copyright (c) 2015-2026 Data King Ltd
 # See LICENSE file for license details
 
 from django import forms
+from django.db import models
+from django.urls import reverse
+
+import collections
+import functools
 
 from .models import *
 
+class LotSelect(forms.Select):
+    """
+    Renders only the selected lot. The other lots are searched in the
+    browser through the lot search view of the account chosen in the same
+    row.
+    """
+
+    class Media:
+        css = {
+            'screen': (
+                'admin/css/vendor/select2/select2.css',
+                'admin/css/autocomplete.css',
+            )
+        }
+        js = (
+            'admin/js/vendor/jquery/jquery.js',
+            'admin/js/vendor/select2/select2.full.js',
+            'admin/js/jquery.init.js',
+            'accounting/js/lot_select.js',
+        )
+
+    def __init__(self, attrs=None):
+        super().__init__({'class': 'lot-select', **(attrs or {})})
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-url'] = reverse(
+            'accounting:lot_search', args=(0,)
+        )
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [v for v in value if str(v).isdigit()]
+        options = [self.create_option(name, '', '', not selected, 0)]
+        if selected:
+            options.extend(
+                self.create_option(name, lot.pk, str(lot), True, i)
+                for i, lot in enumerate(
+                    Lot.objects.select_related('fiscal_year').filter(
+                        pk__in=selected
+                    ),
+                    1
+                )
+            )
+        return [(None, options, 0)]
+
+
 class TransactionItemForm(forms.ModelForm):
     account = forms.ModelChoiceField(
         queryset=Account.objects, required=False, widget=forms.HiddenInput()
     )
     lot = forms.ModelChoiceField(
-        queryset=Lot.objects, required=False, widget=forms.HiddenInput()
+        queryset=Lot.objects, required=False, widget=LotSelect()
     )
     amount = forms.DecimalField(
         required=False,
@@ -19,7 +71,7 @@ class TransactionItemForm(forms.ModelForm):
         widget=forms.HiddenInput()
     )
 
-    target = forms.ChoiceField(label='account and lot')
+    target = forms.ChoiceField(label='account')
     debit = forms.DecimalField(
         label='debit', required=False, max_digits=16, decimal_places=2
     )
@@ -31,44 +83,32 @@ class TransactionItemForm(forms.ModelForm):
         model = TransactionItem
         fields = (
             'target',
+            'lot',
             'debit',
             'credit',
             'description',
             'account',
-            'lot',
             'amount'
         )
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, targets=None, **kwargs):
         super().__init__(*args, **kwargs)
 
-        targets = [('', '-' * 9)]
-        for account in Account.objects.filter(frozen=False).all():
-            targets.append((account.pk, str(account)))
-            if account.lot_tracking:
-                for lot in account.lots:
-                    targets.append(
-                        (
-                            f'{account.pk} {lot.pk}',
-                            f'{account}: {lot} ({lot.get_balance_display()})'
-                        )
-                    )
-
         tfield = self.fields['target']
-        tfield.choices = targets
+        tfield.choices = self.get_targets() if targets is None else targets
         tfield.initial = ''
 
+        self.fields['lot'].widget.attrs['data-accounts'] = ' '.join(
+            str(node.pk) for node in Account.get_tree().nodes.values()
+            if node.lot_tracking and not node.frozen
+        )
+
         item = kwargs.get('instance')
         if not item:
             return
 
-        if item.account:
-            target = [item.account]
-            if item.lot:
-                target.append(item.lot)
-            self.fields['target'].initial = ' '.join(
-                (str(t.pk) for t in target)
-            )
+        if item.account_id:
+            tfield.initial = item.account_id
 
         if item.amount:
             self.fields[
@@ -78,13 +118,29 @@ class TransactionItemForm(forms.ModelForm):
     def clean(self):
         target = self.cleaned_data.get('target')
         if target:
-            target = target.split()
-            self.cleaned_data['account'] = Account.objects.get(pk=target[0])
-            self.cleaned_data['lot'] = Lot.objects.get(
-                pk=target[1]
-            ) if len(target) == 2 else None
+            self.cleaned_data['account'] = Account.get_cached(target)
 
         self.cleaned_data['amount'] = (self.cleaned_data['credit'] or 0) - \
                                       (self.cleaned_data['debit'] or 0)
 
         return self.cleaned_data
+
+    @staticmethod
+    def get_targets():
+        accounts = [
+            account for account in Account.get_tree().get_accounts().values()
+            if not account.frozen
+        ]
+        return [('', '-' * 9)] + [
+            (account.pk, str(account)) for account in accounts
+        ]
+
+
+class TransactionItemFormSet(forms.BaseInlineFormSet):
+
+    @functools.cached_property
+    def targets(self):
+        return TransactionItemForm.get_targets()
+
+    def get_form_kwargs(self, index):
+        return dict(super().get_form_kwargs(index), targets=self.targets)
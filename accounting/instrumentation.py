@@ -0,0 +1,98 @@
+# Copyright (c) 2026 Data King Ltd
+# See LICENSE file for license details
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import Signal
+
+import contextlib
+import functools
+import heapq
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Sent with the name of the measured report or template tag as the sender and
+# the measurement dict as the measurement argument
+measured = Signal()
+
+
+def is_enabled():
+    return getattr(settings, 'ACCOUNTING_INSTRUMENTATION', False)
+
+
+class Measurement(dict):
+
+    def __init__(self, name):
+        super().__init__(
+            name=name, seconds=0, queries=0, sql_seconds=0, slowest=[]
+        )
+        self.limit = getattr(settings, 'ACCOUNTING_INSTRUMENTATION_SLOWEST', 5)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self['queries'] += 1
+            self['sql_seconds'] += elapsed
+            if self.limit:
+                statement = (elapsed, sql)
+                if len(self['slowest']) < self.limit:
+                    heapq.heappush(self['slowest'], statement)
+                else:
+                    heapq.heappushpop(self['slowest'], statement)
+
+    def get_server_timing(self):
+        return (
+            f'{self["name"]};dur={self["seconds"] * 1000:.1f}, '
+            f'db;dur={self["sql_seconds"] * 1000:.1f};'
+            f'desc="{self["queries"]} queries"'
+        )
+
+
+@contextlib.contextmanager
+def measure(name):
+    """
+    Records the wall time, the number of queries, the total SQL time and the
+    slowest statements of the enclosed block.
+
+    Yields None unless the ACCOUNTING_INSTRUMENTATION setting is enabled.
+    Otherwise, yields the measurement, which is logged and sent through the
+    measured signal when the block exits.
+    """
+    if not is_enabled():
+        yield None
+        return
+
+    measurement = Measurement(name)
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(measurement):
+            yield measurement
+    finally:
+        measurement['seconds'] = time.perf_counter() - start
+        measurement['slowest'] = sorted(measurement['slowest'], reverse=True)
+        logger.info(
+            '%s: %.3f s, %d queries, %.3f s in SQL',
+            name,
+            measurement['seconds'],
+            measurement['queries'],
+            measurement['sql_seconds'],
+            extra={'measurement': measurement}
+        )
+        measured.send(sender=name, measurement=measurement)
+
+
+def instrumented(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with measure(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
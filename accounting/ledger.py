@@ -0,0 +1,474 @@
+# Copyright (c) 2026 Data King Ltd
+# See LICENSE file for license details
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+import array
+from decimal import Decimal as D
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def is_enabled():
+    return getattr(settings, 'ACCOUNTING_LEDGER_SNAPSHOT', False)
+
+
+def get_archive_dir():
+    return getattr(settings, 'ACCOUNTING_ARCHIVE_DIR', None)
+
+
+def to_decimal(cents):
+    return D(int(cents)).scaleb(-2)
+
+
+class ArchivedYear:
+    """
+    Committed items of a closed fiscal year, stored in a file as fixed-width
+    columns of 64-bit integers in the byte order of the platform.
+
+    The file is memory-mapped, and each column is exposed as a memoryview of
+    the mapping, so opening an archive reads nothing but the header. The
+    columns are those of a ledger snapshot segment, sorted by the key.
+    """
+
+    magic = b'ACCTARC2'
+    header = struct.Struct('=8sqq')
+    columns = ('account', 'period', 'lot', 'transaction', 'key', 'cents')
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.fiscal_year, self.count = self.header.unpack_from(
+            self.mmap
+        )
+        size = self.count * 8
+        if magic != self.magic or len(self.mmap) != \
+           self.header.size + size * len(self.columns):
+            raise ValueError(f'Invalid fiscal year archive: {path}')
+
+        view = memoryview(self.mmap)
+        for i, name in enumerate(self.columns):
+            start = self.header.size + i * size
+            setattr(self, name, view[start:start + size].cast('q'))
+
+    def array(self, name):
+        return numpy.frombuffer(getattr(self, name), dtype=numpy.int64)
+
+    @staticmethod
+    def get_path(directory, fiscal_year):
+        return os.path.join(directory, f'{fiscal_year.pk}.items')
+
+    @staticmethod
+    def read_items(items):
+        """
+        Returns the columns of the given committed items as arrays, sorted
+        by the key.
+        """
+        columns = [array.array('q') for __ in ArchivedYear.columns]
+        for account, period, lot, txn, date, closing, amount in \
+            items.values_list(
+                'account',
+                'transaction__period',
+                'lot',
+                'transaction',
+                'transaction__date',
+                'transaction__closing',
+                'amount'
+            ).order_by(
+                'transaction__date', 'transaction__closing'
+            ).iterator():
+
+            columns[0].append(account)
+            columns[1].append(period)
+            columns[2].append(lot or 0)
+            columns[3].append(txn)
+            columns[4].append(date.toordinal() * 2 + closing)
+            columns[5].append(int(amount * 100))
+        return columns
+
+    @classmethod
+    def write(cls, directory, fiscal_year):
+        from .models import TransactionItem
+
+        if not fiscal_year.closed:
+            raise ValueError(f'Fiscal year {fiscal_year} not closed')
+
+        columns = cls.read_items(
+            TransactionItem.objects.filter(
+                transaction__state='C', transaction__fiscal_year=fiscal_year
+            )
+        )
+        path = cls.get_path(directory, fiscal_year)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(
+                cls.header.pack(cls.magic, fiscal_year.pk, len(columns[0]))
+            )
+            for column in columns:
+                column.tofile(f)
+        os.replace(path + '.tmp', path)
+        return cls(path)
+
+    @classmethod
+    def open_all(cls, directory=None):
+        """
+        Returns the archives of closed fiscal years found in the directory,
+        by default ACCOUNTING_ARCHIVE_DIR, keyed by fiscal year id. Raises
+        ValueError if an archive holds the items of another fiscal year
+        than the one its path belongs to.
+        """
+        from .models import FiscalYear
+
+        directory = directory or get_archive_dir()
+        if not directory:
+            return {}
+
+        res = {}
+        for fy in FiscalYear.objects.filter(closed=True):
+            path = cls.get_path(directory, fy)
+            if os.path.exists(path):
+                archive = cls(path)
+                if archive.fiscal_year != fy.pk:
+                    raise ValueError(
+                        f'Archive of fiscal year {archive.fiscal_year} '
+                        f'found for {fy}: {path}'
+                    )
+                res[fy.pk] = archive
+        return res
+
+
+class Ledger:
+    """
+    Column arrays of all committed transaction items, in segments loaded in
+    one query and from the archives of closed fiscal years.
+
+    Each item has the ids of its account, fiscal period, lot and
+    transaction, the amount in integer cents, and a sort key of twice the
+    date ordinal plus the closing flag. A balance as of a date therefore
+    covers the items whose key does not exceed twice the ordinal of the
+    date, as in TransactionItem.date_filter.
+
+    Each segment is sorted by the key, and the segments of archived years
+    are the memory-mapped columns themselves, which are never copied. The
+    ids are mapped to the rows of the result matrices when aggregating.
+    Balances of all accounts at many dates are computed by slicing each
+    segment between the dates with searchsorted, summing the slices with
+    bincount, and accumulating the sums with cumsum.
+    """
+
+    _cache = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_cache(cls):
+        from .models import ProcessCache
+
+        with cls._lock:
+            if cls._cache is None:
+                cls._cache = ProcessCache(
+                    'ledger', lambda version: cls(), cls.get_version
+                )
+            return cls._cache
+
+    def __init__(self):
+        if numpy is None:
+            raise ImproperlyConfigured(
+                'ACCOUNTING_LEDGER_SNAPSHOT requires NumPy'
+            )
+        from .models import Account, FiscalPeriod, TransactionItem
+
+        # Items of closed fiscal years are read from their archives, if any
+        archives = ArchivedYear.open_all()
+        self.segments = [
+            {
+                name: numpy.frombuffer(column, dtype=numpy.int64)
+                for name, column in zip(
+                    ArchivedYear.columns,
+                    ArchivedYear.read_items(
+                        TransactionItem.objects.filter(
+                            transaction__state='C'
+                        ).exclude(transaction__fiscal_year__in=archives)
+                    )
+                )
+            }
+        ] + [
+            {name: archive.array(name) for name in ArchivedYear.columns}
+            for archive in archives.values()
+        ]
+
+        # The accounts and periods are loaded after the items, and the
+        # account tree is reloaded if it is missing any account of the items
+        tree = Account.get_tree()
+        if not all(
+                numpy.isin(segment['account'], list(tree.nodes)).all()
+                for segment in self.segments
+        ):
+            tree = Account.get_tree(reload=True)
+        accounts = [
+            (node.pk, node.tree_id, node.lft, node.rght, node.type)
+            for node in tree.ordered
+        ]
+        self.accounts = numpy.array([a[0] for a in accounts], dtype=int)
+
+        # Nodes are encoded as single integers, so that the subtree of an
+        # account is a contiguous range in tree order
+        width = max((a[3] for a in accounts), default=0) + 1
+        self.nodes = numpy.array(
+            [tree_id * width + lft for __, tree_id, lft, __, __ in accounts],
+            dtype=int
+        )
+        self.subtree_ends = numpy.searchsorted(
+            self.nodes,
+            [tree_id * width + rght for __, tree_id, __, rght, __ in accounts],
+            side='right'
+        )
+        self.pl = numpy.array(
+            [a[4] in Account.TYPES_PL for a in accounts], dtype=bool
+        )
+        self.ne = numpy.array([a[4] == 'NE' for a in accounts], dtype=int)
+
+        self.periods = numpy.array(
+            FiscalPeriod.objects.order_by('start').values_list(
+                'pk', flat=True
+            ),
+            dtype=int
+        )
+
+        self.account_index = self.get_index(self.accounts, 'account', Account)
+        self.period_index = self.get_index(
+            self.periods, 'period', FiscalPeriod
+        )
+
+    def get_index(self, ids, column, model):
+        """
+        Returns an array mapping the ids in the given column of the segments
+        to their indices in ids.
+        """
+        res = numpy.full(
+            max(
+                [ids.max(initial=0)] + [
+                    segment[column].max(initial=0)
+                    for segment in self.segments
+                ]
+            ) + 1,
+            -1
+        )
+        res[ids] = numpy.arange(len(ids))
+        for segment in self.segments:
+            if (res[segment[column]] < 0).any():
+                raise model.DoesNotExist(
+                    f'Unknown {model._meta.model_name} in the ledger'
+                )
+        return res
+
+    @classmethod
+    def get_version(cls):
+        from .models import FiscalYear
+        return tuple(
+            FiscalYear.objects.order_by('pk').values_list('pk', 'version')
+        )
+
+    @classmethod
+    def load(cls):
+        """
+        Returns the process-level snapshot. It is dropped when a fiscal year
+        is touched in this process, and reloaded when the versions of the
+        fiscal years, read at most once per request like those of the other
+        process-wide caches, show a change by another process.
+        """
+        return cls.get_cache().get()
+
+    @classmethod
+    def invalidate(cls):
+        cls.get_cache().drop()
+
+    def sum_buckets(self, column, index, size, dates):
+        """
+        Returns a matrix of the balances at the given dates, with a row for
+        each value of index, given for the ids in column and less than
+        size. None stands for the end of the ledger.
+        """
+        dates = list(dates)
+        keys = sorted(
+            {date.toordinal() * 2 for date in dates if date is not None}
+        )
+        columns = len(keys) + 1
+        sums = numpy.zeros((columns, size))
+        for segment in self.segments:
+            bounds = [0] + list(
+                numpy.searchsorted(segment['key'], keys, side='right')
+            ) + [len(segment['key'])]
+            for i in range(columns):
+                items = slice(bounds[i], bounds[i + 1])
+                sums[i] += numpy.bincount(
+                    index[segment[column][items]],
+                    weights=segment['cents'][items],
+                    minlength=size
+                )
+        matrix = numpy.cumsum(numpy.rint(sums).astype(int).T, axis=1)
+        return matrix[
+            :,
+            [
+                columns - 1 if date is None else
+                keys.index(date.toordinal() * 2)
+                for date in dates
+            ]
+        ]
+
+    def balances(self, dates, children=False):
+        """
+        Returns the balances of all accounts in cents at the given dates, as
+        a matrix with a row for each account in the accounts array.
+
+        With children, each row is the total of the subtree of the account,
+        and subtrees containing a net earnings account include the balance of
+        all income and expense accounts.
+        """
+        size = len(self.accounts)
+        own = self.sum_buckets('account', self.account_index, size, dates)
+        if not children:
+            return own
+
+        totals = numpy.vstack(
+            (numpy.zeros((1, own.shape[1]), dtype=int), numpy.cumsum(own, 0))
+        )
+        res = totals[self.subtree_ends] - totals[:size]
+
+        ne = numpy.concatenate(((0,), numpy.cumsum(self.ne)))
+        has_ne = ne[self.subtree_ends] > ne[:size]
+        res[has_ne] += own[self.pl].sum(axis=0)
+        return res
+
+    def get_balances(self, dates, children=False):
+        """
+        Returns a dict mapping account ids to lists of balances as Decimals.
+        """
+        return {
+            int(pk): [to_decimal(b) for b in balances]
+            for pk, balances in zip(
+                self.accounts, self.balances(dates, children)
+            )
+        }
+
+    def get_rows(self, pk, children=False):
+        """
+        Returns the range of rows of the account, or of its subtree with
+        children, or None if the account has no row.
+        """
+        if pk >= len(self.account_index) or self.account_index[pk] < 0:
+            return None
+        i = int(self.account_index[pk])
+        return range(i, int(self.subtree_ends[i]) if children else i + 1)
+
+    def get_balance(self, pk, date=None, children=False):
+        """
+        Returns the balance of one account as a Decimal, summing only the
+        items of its rows, and with children those of all income and expense
+        accounts if its subtree contains a net earnings account, as in
+        balances.
+        """
+        rows = self.get_rows(pk, children)
+        if rows is None:
+            return to_decimal(0)
+        with_pl = children and self.ne[rows.start:rows.stop].any()
+
+        cents = 0
+        for segment in self.segments:
+            end = len(segment['key']) if date is None else \
+                numpy.searchsorted(
+                    segment['key'], date.toordinal() * 2, side='right'
+                )
+            index = self.account_index[segment['account'][:end]]
+            amounts = segment['cents'][:end]
+            cents += int(
+                amounts[(index >= rows.start) & (index < rows.stop)].sum()
+            )
+            if with_pl:
+                cents += int(amounts[self.pl[index]].sum())
+        return to_decimal(cents)
+
+    def get_lot_balances(self, dates):
+        """
+        Returns a dict mapping the ids of the lots with items to lists of
+        balances as Decimals.
+        """
+        lots = numpy.unique(
+            numpy.concatenate(
+                [numpy.unique(segment['lot']) for segment in self.segments]
+            )
+        )
+        index = numpy.zeros(lots.max(initial=0) + 1, dtype=int)
+        index[lots] = numpy.arange(len(lots))
+        return {
+            int(lot): [to_decimal(b) for b in balances]
+            for lot, balances in zip(
+                lots, self.sum_buckets('lot', index, len(lots), dates)
+            ) if lot
+        }
+
+    def period_totals(self, children=False):
+        """
+        Returns the debit and credit totals of each account in each fiscal
+        period in cents, as a pair of matrices with a row for each account
+        in the accounts array and a column for each period in the periods
+        array. With children, each row is the total of the subtree of the
+        account.
+        """
+        size = len(self.accounts)
+        columns = len(self.periods)
+        sums = numpy.zeros((2, size * columns))
+        for segment in self.segments:
+            cells = self.account_index[segment['account']] * columns + \
+                self.period_index[segment['period']]
+            for i, cents in enumerate((-segment['cents'], segment['cents'])):
+                sums[i] += numpy.bincount(
+                    cells,
+                    weights=numpy.maximum(cents, 0),
+                    minlength=size * columns
+                )
+        res = numpy.rint(sums).astype(int).reshape(2, size, columns)
+        if children:
+            totals = numpy.concatenate(
+                (
+                    numpy.zeros((2, 1, columns), dtype=int),
+                    numpy.cumsum(res, 1)
+                ),
+                1
+            )
+            res = totals[:, self.subtree_ends] - totals[:, :size]
+        return res[0], res[1]
+
+    def get_period_totals(self, pk):
+        """
+        Returns a dict mapping the ids of the fiscal periods with items in
+        the subtree of the account to their debit and credit totals as
+        Decimals, summing only the items of the subtree.
+        """
+        rows = self.get_rows(pk, True)
+        if rows is None:
+            return {}
+
+        size = len(self.periods)
+        sums = numpy.zeros((2, size))
+        for segment in self.segments:
+            index = self.account_index[segment['account']]
+            items = (index >= rows.start) & (index < rows.stop)
+            periods = self.period_index[segment['period'][items]]
+            cents = segment['cents'][items]
+            for i, amounts in enumerate((-cents, cents)):
+                sums[i] += numpy.bincount(
+                    periods, weights=numpy.maximum(amounts, 0), minlength=size
+                )
+        debit, credit = numpy.rint(sums).astype(int)
+        return {
+            int(pk): (to_decimal(d), to_decimal(c))
+            for pk, d, c in zip(self.periods, debit, credit) if d or c
+        }
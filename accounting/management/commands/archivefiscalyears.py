@@ -0,0 +1,43 @@
+# Copyright (c) 2026 Data King Ltd
+# See LICENSE file for license details
+
+from django.core.management.base import BaseCommand, CommandError
+
+import os
+
+from ...ledger import ArchivedYear, get_archive_dir
+from ...models import FiscalYear
+
+
+class Command(BaseCommand):
+    help = 'Writes the transaction items of closed fiscal years to ' \
+        'memory-mappable column files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory',
+            help='directory of the archives (default: ACCOUNTING_ARCHIVE_DIR)'
+        )
+        parser.add_argument(
+            '--overwrite', action='store_true',
+            help='rewrite existing archives'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['directory'] or get_archive_dir()
+        if not directory:
+            raise CommandError(
+                'No directory given and ACCOUNTING_ARCHIVE_DIR not set'
+            )
+        os.makedirs(directory, exist_ok=True)
+
+        count = 0
+        for fy in FiscalYear.objects.filter(closed=True).order_by('start'):
+            if not options['overwrite'] and \
+               os.path.exists(ArchivedYear.get_path(directory, fy)):
+                continue
+            archive = ArchivedYear.write(directory, fy)
+            self.stdout.write(f'{fy}: {archive.count} items')
+            count += 1
+
+        self.stdout.write(f'{count} fiscal years archived')
@@ -0,0 +1,244 @@
+# Copyright (c) 2026 Data King Ltd
+# See LICENSE file for license details
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.transaction import atomic, set_rollback
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment
+)
+from django.urls import URLPattern, reverse
+
+import datetime
+from decimal import Decimal as D
+import django
+import json
+import time
+
+from ... import ledger, urls
+from ...models import *
+
+
+class Command(BaseCommand):
+    help = 'Times the reports, admin pages and bulk operations of the ledger'
+
+    admin_models = ('account', 'lot', 'transaction', 'fiscalyear', 'journal')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fiscal-year',
+            help='fiscal year of the reports (default: the latest one)'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='number of runs per case, the fastest of which is reported'
+        )
+        parser.add_argument(
+            '--post', type=int, default=1000,
+            help='number of transactions in the bulk posting case'
+        )
+        parser.add_argument('--output', help='JSON file for the results')
+
+    def handle(self, *args, **options):
+        fyears = FiscalYear.objects.filter(transaction__isnull=False)
+        if options['fiscal_year']:
+            fyears = fyears.filter(
+                pk=FiscalYear.by_label(options['fiscal_year']).pk
+            )
+        fy = fyears.order_by('-end').first()
+        if not fy:
+            raise CommandError('No transactions to benchmark')
+
+        self.repeat = options['repeat']
+        self.results = []
+
+        setup_test_environment()
+        try:
+            with atomic():
+                self.run_ledger()
+                self.run_views(fy)
+                self.run_admin()
+                self.run_post(options['post'])
+                self.run_close()
+                set_rollback(True)
+        finally:
+            DateRange.invalidate_calendars()
+
+        report = json.dumps(
+            {
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'fiscal_year': str(fy),
+                'ledger': {
+                    'accounts': Account.objects.count(),
+                    'fiscal_years': FiscalYear.objects.count(),
+                    'transactions': Transaction.objects.count(),
+                    'items': TransactionItem.objects.count(),
+                    'lots': Lot.objects.count()
+                },
+                'results': self.results
+            },
+            indent=2
+        )
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+    def measure(self, name, func, repeat=None):
+        seconds = None
+        for __ in range(repeat or self.repeat):
+            connection.queries_log.clear()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+        self.results.append(
+            {
+                'name': name,
+                'queries': len(queries.captured_queries),
+                'seconds': round(seconds, 4)
+            }
+        )
+        self.stderr.write(
+            f'{name}: {seconds:.3f} s, '
+            f'{len(queries.captured_queries)} queries'
+        )
+
+    def get(self, client, url):
+        def func():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: HTTP {response.status_code}')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            else:
+                response.content
+        return func
+
+    def run_views(self, fy):
+        journal = Journal.objects.exclude(closing=True).first()
+        account = Account.objects.filter(lot_tracking=True).first()
+        values = {
+            'fy': str(fy),
+            'code': journal and journal.code,
+            'account': account and account.pk
+        }
+
+        client = Client()
+        for pattern in urls.urlpatterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            params = pattern.pattern.converters
+            if any(
+                    values.get(param) is None
+                    for param in params if param != 'format'
+            ):
+                continue
+            formats = ('csv', 'jsonl') if 'format' in params else (None,)
+            for format in formats:
+                kwargs = {
+                    param: format if param == 'format' else values[param]
+                    for param in params
+                }
+                url = reverse(
+                    f'{urls.app_name}:{pattern.name}', kwargs=kwargs
+                )
+                self.measure(
+                    ' '.join(filter(None, (pattern.name, format))),
+                    self.get(client, url)
+                )
+
+    def run_admin(self):
+        user = get_user_model().objects.create_superuser(
+            'benchmark', 'benchmark@example.com', None
+        )
+        client = Client()
+        client.force_login(user)
+
+        for model in self.admin_models:
+            url = reverse(f'admin:accounting_{model}_changelist')
+            self.measure(f'admin {model} changelist', self.get(client, url))
+
+        txn = Transaction.objects.order_by('-pk').first()
+        if txn:
+            url = reverse(
+                'admin:accounting_transaction_change', args=(txn.pk,)
+            )
+            self.measure('admin transaction change', self.get(client, url))
+
+    def run_close(self):
+        fy = FiscalYear.objects.filter(
+            closed=False, transaction__isnull=False
+        ).order_by('end').first()
+        if fy:
+            self.measure('close fiscal year', fy.close, repeat=1)
+
+    def run_post(self, count):
+        accounts = list(
+            Account.objects.filter(frozen=False, lot_tracking=False)[:2]
+        )
+        journal = Journal.objects.exclude(closing=True).first()
+        fy = FiscalYear.objects.filter(closed=False).order_by('-end').first()
+        if len(accounts) < 2 or not journal or not count or not fy:
+            return
+
+        def func():
+            Transaction.objects.post_many(
+                (
+                    Transaction(
+                        journal=journal,
+                        date=fy.start + datetime.timedelta(days=i % 28)
+                    ),
+                    [
+                        TransactionItem(account=accounts[0], amount=-D(i)),
+                        TransactionItem(account=accounts[1], amount=D(i))
+                    ]
+                ) for i in range(1, count + 1)
+            )
+        self.measure(f'post {count} transactions', func, repeat=1)
+
+    def run_ledger(self):
+        if ledger.numpy is None:
+            return
+
+        dates = tuple(
+            FiscalYear.objects.order_by('end').values_list('end', flat=True)
+        ) + (None,)
+        snapshot = None
+
+        def load():
+            nonlocal snapshot
+            snapshot = ledger.Ledger()
+        self.measure('ledger load', load)
+
+        balances = None
+
+        def compute():
+            nonlocal balances
+            balances = snapshot.get_balances(dates, True)
+        self.measure('ledger balances', compute)
+
+        def compute_orm():
+            with override_settings(ACCOUNTING_LEDGER_SNAPSHOT=False):
+                list(Account.objects.with_balances(dates, children=True))
+        self.measure('orm balances', compute_orm)
+
+        with override_settings(ACCOUNTING_LEDGER_SNAPSHOT=False):
+            for account in Account.objects.with_balances(
+                    dates, children=True
+            ):
+                expected = [
+                    account.get_balance(date=date, children=True)
+                    for date in dates
+                ]
+                if balances[account.pk] != expected:
+                    raise CommandError(
+                        f'Ledger snapshot balances of {account} differ: '
+                        f'{balances[account.pk]} != {expected}'
+                    )
@@ -0,0 +1,194 @@
+# Copyright (c) 2026 Data King Ltd
+# See LICENSE file for license details
+
+from django.core.management.base import BaseCommand, CommandError
+
+import datetime
+from decimal import Decimal as D
+import random
+
+from ...models import *
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic ledger for performance measurements'
+
+    groups = (
+        ('As', 'Assets', '1'),
+        ('Li', 'Liabilities', '2'),
+        ('Eq', 'Equity', '3'),
+        ('In', 'Income', '4'),
+        ('Ex', 'Expenses', '5')
+    )
+    group_size = 10
+    chunk_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--accounts', type=int, default=50,
+            help='number of postable accounts'
+        )
+        parser.add_argument(
+            '--lot-accounts', type=int, default=5,
+            help='number of lot-tracking balance sheet accounts'
+        )
+        parser.add_argument(
+            '--years', type=int, default=3, help='number of fiscal years'
+        )
+        parser.add_argument(
+            '--closed', type=int,
+            help='number of fiscal years to close (default: all but the last)'
+        )
+        parser.add_argument(
+            '--per-day', type=int, default=5,
+            help='number of transactions per day'
+        )
+        parser.add_argument(
+            '--start', type=int,
+            help='first calendar year (default: years before the current one)'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if Account.objects.exists() or Transaction.objects.exists():
+            raise CommandError('The ledger must be empty')
+
+        years = options['years']
+        closed = years - 1 if options['closed'] is None else options['closed']
+        start = options['start'] or datetime.date.today().year - years + 1
+        self.random = random.Random(options['seed'])
+
+        accounts = self.create_accounts(
+            options['accounts'], options['lot_accounts']
+        )
+        journals = [
+            Journal.objects.create(code=code, description=description)
+            for code, description in (('C', 'Cash'), ('S', 'Sales'))
+        ]
+        Journal.objects.create(
+            code='X', description='Transfer', closing=True
+        )
+
+        lots = {}
+        for i, year in enumerate(range(start, start + years)):
+            date = datetime.date(year, 1, 1)
+            entries = []
+            while date.year == year:
+                for __ in range(options['per_day']):
+                    entries.append(
+                        self.create_entry(date, journals, accounts, lots)
+                    )
+                    if len(entries) == self.chunk_size:
+                        self.post(entries, lots)
+                        entries = []
+                date += datetime.timedelta(days=1)
+            self.post(entries, lots)
+
+            if i < closed:
+                FiscalYear.by_date(datetime.date(year, 12, 31)).close()
+
+        self.stdout.write(
+            f'{Account.objects.count()} accounts, '
+            f'{FiscalYear.objects.count()} fiscal years, '
+            f'{Transaction.objects.count()} transactions, '
+            f'{TransactionItem.objects.count()} items and '
+            f'{Lot.objects.count()} lots generated'
+        )
+
+    def create_accounts(self, count, lot_count):
+        accounts = []
+        res = []
+        for i, (type, name, prefix) in enumerate(self.groups):
+            parent = Account(
+                name=name,
+                type=type,
+                public=True,
+                frozen=True,
+                lot_tracking=False
+            )
+            accounts.append(parent)
+            leaves = count // len(self.groups) + (
+                i < count % len(self.groups)
+            )
+            subgroup = None
+            for j in range(leaves):
+                if not j % self.group_size:
+                    subgroup = Account(
+                        name=f'{name} {j // self.group_size + 1}',
+                        parent=parent,
+                        type=type,
+                        public=True,
+                        frozen=True,
+                        lot_tracking=False
+                    )
+                    accounts.append(subgroup)
+                lot_tracking = type in ('As', 'Li') and lot_count > 0
+                if lot_tracking:
+                    lot_count -= 1
+                res.append(
+                    Account(
+                        name=f'{name} {j + 1}',
+                        code=f'{prefix}{j + 1:03}',
+                        parent=subgroup,
+                        type=type,
+                        public=True,
+                        frozen=False,
+                        lot_tracking=lot_tracking
+                    )
+                )
+                accounts.append(res[-1])
+
+            if type == 'Eq':
+                accounts.append(
+                    Account(
+                        name='Net earnings',
+                        code='3999',
+                        parent=parent,
+                        type='NE',
+                        public=True,
+                        frozen=False,
+                        lot_tracking=False
+                    )
+                )
+
+        Account.objects.bulk_import(accounts)
+        return res
+
+    def create_entry(self, date, journals, accounts, lots):
+        items = []
+        for account in self.random.sample(
+                accounts, self.random.choice((2, 2, 2, 3))
+        ):
+            item = TransactionItem(account=account, amount=D(0))
+            if account.lot_tracking and account.pk in lots and \
+               self.random.random() < 0.5:
+                item.lot_id = self.random.choice(lots[account.pk])
+            items.append(item)
+
+        for item in items[1:]:
+            item.amount = D(self.random.randint(100, 1000000)) / 100
+            items[0].amount -= item.amount
+        if self.random.random() < 0.5:
+            for item in items:
+                item.amount = -item.amount
+
+        return (
+            Transaction(
+                journal=self.random.choice(journals),
+                date=date,
+                description=f'Transaction on {date}'
+            ),
+            items
+        )
+
+    def post(self, entries, lots):
+        if not entries:
+            return
+
+        new_lots = [
+            item for __, items in entries for item in items
+            if item.account.lot_tracking and not item.lot_id
+        ]
+        Transaction.objects.post_many(entries)
+        for item in new_lots:
+            lots.setdefault(item.account_id, []).append(item.lot.pk)
@@ -0,0 +1,52 @@
+# Copyright (c) 2026 Data King Ltd
+# See LICENSE file for license details
+
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.transaction import atomic
+
+import os
+
+from ...models import Account
+
+
+class Command(BaseCommand):
+    help = 'Imports a chart of accounts from fixture files in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs='+', metavar='fixture')
+
+    def handle(self, *args, **options):
+        accounts = []
+        models = {Account}
+
+        with atomic():
+            for path in options['fixtures']:
+                format = os.path.splitext(path)[1][1:]
+                try:
+                    with open(path) as f:
+                        objects = list(serializers.deserialize(format, f))
+                except serializers.SerializerDoesNotExist:
+                    raise CommandError(f'Unknown fixture format: {path}')
+
+                # Other objects, such as journals, are loaded as by loaddata
+                for obj in objects:
+                    if isinstance(obj.object, Account):
+                        accounts.append(obj.object)
+                    else:
+                        obj.save()
+                        models.add(type(obj.object))
+
+            Account.objects.bulk_import(accounts)
+
+            sequence_sql = connection.ops.sequence_reset_sql(
+                no_style(), models
+            )
+            if sequence_sql:
+                with connection.cursor() as cursor:
+                    for line in sequence_sql:
+                        cursor.execute(line)
+
+        self.stdout.write(f'{len(accounts)} accounts imported')
@@ -0,0 +1,19 @@
+# Copyright (c) 2026 Data King Ltd
+# See LICENSE file for license details
+
+from django.core.management.base import BaseCommand
+
+from ...models import AccountDailyBalance, AccountPeriodBalance
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-period and daily account balances from ' \
+        'transaction items'
+
+    def handle(self, *args, **options):
+        AccountPeriodBalance.rebuild()
+        AccountDailyBalance.rebuild()
+        self.stdout.write(
+            f'{AccountPeriodBalance.objects.count()} period balances and '
+            f'{AccountDailyBalance.objects.count()} daily balances rebuilt'
+        )
@@ -1,9 +1,180 @@
-# Copyright (c) 2015-2022 Data King Ltd
+# Copyright (c) 2015-2026 Data King Ltd
 # See LICENSE file for license details
 
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, models
+from django.db.transaction import atomic
 from mptt.managers import TreeManager
+from mptt.querysets import TreeQuerySet
 
-class AccountManager(TreeManager):
+import collections
+import datetime
+import functools
+import time
+
+
+def atomic_write(func):
+    """
+    Runs the function in a database transaction, like atomic, and takes the
+    write lock of an SQLite database at the start of the transaction.
+
+    SQLite fails a transaction that reads and then writes while another one
+    is writing, instead of waiting for it. Taking the lock with a write that
+    changes nothing makes concurrent committers wait for each other within
+    the busy timeout. Other databases lock the rows as they go.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with atomic():
+            if connection.vendor == 'sqlite':
+                from .models import CacheVersion
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'UPDATE {CacheVersion._meta.db_table} '
+                        'SET version = version WHERE 0'
+                    )
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def bulk_insert(queryset, objs):
+    """
+    Inserts the given unsaved instances in bulk, or one by one on databases
+    whose bulk inserts do not return the primary keys, such as MySQL, so
+    that the keys are set in either case. The save methods of the model are
+    bypassed, as by bulk_create.
+    """
+    if connections[queryset.db].features.can_return_rows_from_bulk_insert:
+        return queryset.bulk_create(objs)
+
+    for obj in objs:
+        obj.save_base(force_insert=True, using=queryset.db)
+    return objs
+
+
+class AccountQuerySet(TreeQuerySet):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._balance_dates = ()
+        self._balance_children = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._balance_dates = self._balance_dates
+        clone._balance_children = self._balance_children
+        return clone
+
+    def _fetch_all(self):
+        load = self._result_cache is None and self._balance_dates
+        super()._fetch_all()
+        if load:
+            self.model.load_balances(
+                [obj for obj in self._result_cache
+                 if isinstance(obj, self.model)],
+                self._balance_dates,
+                self._balance_children
+            )
+
+    def with_balances(self, dates, children=False):
+        clone = self._chain()
+        clone._balance_dates = tuple(dates)
+        clone._balance_children = children
+        return clone
+
+    @atomic
+    def bulk_import(self, accounts):
+        """
+        Inserts a batch of new accounts with a single rebuild of the tree.
+
+        accounts is an iterable of unsaved accounts, whose parents are either
+        existing accounts or other accounts of the batch, given as instances
+        or by primary key. The accounts are inserted in bulk level by level,
+        the order fields of the new accounts and their existing ancestors are
+        computed bottom-up in memory, and the tree fields are rebuilt once
+        at the end. Returns the list of inserted accounts. The accounts are
+        inserted one by one on databases whose bulk inserts do not return the
+        primary keys.
+        """
+        from .models import FiscalYear
+
+        accounts = list(accounts)
+        if not accounts:
+            return accounts
+
+        codes = [account.code for account in accounts if account.code]
+        if len(set(codes)) < len(codes) or \
+           self.model.objects.filter(code__in=codes).exists():
+            raise ValidationError('Duplicate account code')
+
+        batch = {id(account) for account in accounts}
+        by_pk = {
+            account.pk: account for account in accounts
+            if account.pk is not None
+        }
+
+        def get_parent(account):
+            if self.model.parent.is_cached(account):
+                parent = account.parent
+                return parent if id(parent) in batch else None
+            return by_pk.get(account.parent_id)
+
+        depths = {}
+
+        def get_depth(account):
+            if id(account) not in depths:
+                parent = get_parent(account)
+                depths[id(account)] = get_depth(parent) + 1 if parent else 0
+            return depths[id(account)]
+
+        levels = collections.defaultdict(list)
+        children = collections.defaultdict(list)
+        for account in accounts:
+            levels[get_depth(account)].append(account)
+            parent = get_parent(account)
+            if parent:
+                children[id(parent)].append(account)
+
+        for level in sorted(levels, reverse=True):
+            for account in levels[level]:
+                if account.is_pl_account:
+                    account.lot_tracking = False
+                account.order = account.code or min(
+                    (child.order for child in children[id(account)]),
+                    default=''
+                )
+                account.lft = account.rght = account.tree_id = 0
+                account.level = 0
+
+        for level in sorted(levels):
+            bulk_insert(self.model.objects, levels[level])
+
+        parents = {
+            account.parent_id for account in accounts
+            if not get_parent(account) and account.parent_id
+        }
+        while parents:
+            updated = set()
+            for parent in self.model.objects.filter(pk__in=parents):
+                order = parent.code or min(
+                    parent.children.values_list('order', flat=True),
+                    default=''
+                )
+                if order != parent.order:
+                    self.model.objects.filter(pk=parent.pk).update(
+                        order=order
+                    )
+                    if parent.parent_id:
+                        updated.add(parent.parent_id)
+            parents = updated
+
+        self.model._tree_manager.rebuild()
+        self.model.invalidate_tree()
+        FiscalYear.touch()
+        return accounts
+
+
+class AccountManager(TreeManager.from_queryset(AccountQuerySet)):
 
     def __init__(self, *types):
         super().__init__()
@@ -14,3 +185,165 @@ class AccountManager(TreeManager):
         if self.types:
             qs = qs.filter(type__in=self.types)
         return qs
+
+
+class LotQuerySet(models.QuerySet):
+
+    def with_balances(self):
+        return self.select_related('account', 'fiscal_year').annotate(
+            committed_balance=models.Sum('period_balances__net')
+        )
+
+
+class TransactionQuerySet(models.QuerySet):
+
+    def with_balances(self):
+        return self.select_related('journal', 'fiscal_year').annotate(
+            item_total=models.Sum('item__amount')
+        )
+
+    def with_items(self):
+        return self.select_related('journal').prefetch_related(
+            'items__account', 'items__lot__fiscal_year'
+        )
+
+    @atomic_write
+    def post_many(self, entries):
+        """
+        Commits a batch of new transactions with a fixed number of queries.
+
+        entries is an iterable of (transaction, items) pairs, where both the
+        transaction and its items are unsaved instances. The transactions are
+        validated as Transaction.commit would do, numbered from blocks
+        reserved in the journal sequences, and then inserted in bulk.
+        Returns the list of committed transactions.
+
+        On databases whose bulk inserts do not return the primary keys, the
+        new transactions and lots are inserted one by one (see bulk_insert).
+        """
+        from .models import (
+            Account,
+            AccountDailyBalance,
+            AccountPeriodBalance,
+            FiscalPeriod,
+            FiscalYear,
+            JournalSequence,
+            Lot,
+            LotSequence,
+            TransactionItem
+        )
+
+        entries = [(txn, list(items)) for txn, items in entries]
+        all_items = [item for __, items in entries for item in items]
+
+        accounts = Account.objects.in_bulk(
+            {item.account_id for item in all_items}
+        )
+        lots = Lot.objects.select_related('account').in_bulk(
+            {item.lot_id for item in all_items if item.lot_id}
+        )
+
+        today = datetime.date.fromtimestamp(time.time())
+        fyears = set()
+
+        for txn, items in entries:
+            if txn.pk:
+                raise ValidationError(f'Transaction {txn} already saved')
+
+            if not items:
+                raise ValidationError('Cannot commit an empty transaction')
+
+            if sum(item.amount for item in items):
+                raise ValidationError('Imbalanced transaction')
+
+            if not txn.date:
+                txn.date = today
+            txn.period = FiscalPeriod.by_date(txn.date)
+            txn.fiscal_year = txn.period.fiscal_year
+            if txn.fiscal_year.pk not in fyears:
+                txn.fiscal_year.refresh_from_db(fields=('closed',))
+                fyears.add(txn.fiscal_year.pk)
+            if txn.fiscal_year.closed:
+                raise ValidationError(
+                    f'Fiscal year {txn.fiscal_year} already closed'
+                )
+
+            for item in items:
+                if item.account_id not in accounts:
+                    raise ValidationError(
+                        f'Unknown account: {item.account_id}'
+                    )
+                item.account = accounts[item.account_id]
+                if item.lot_id:
+                    if item.lot_id not in lots:
+                        raise ValidationError(f'Unknown lot: {item.lot_id}')
+                    item.lot = lots[item.lot_id]
+                item.clean()
+
+        pending = collections.defaultdict(list)
+        explicit = collections.defaultdict(int)
+        numbers = collections.Counter()
+        for txn, __ in entries:
+            key = (txn.journal_id, txn.fiscal_year_id)
+            if txn.number:
+                explicit[key] = max(explicit[key], txn.number)
+                numbers[key + (txn.number,)] += 1
+            else:
+                pending[key].append(txn)
+            txn.state = 'C'
+
+        for key in sorted(pending.keys() | explicit.keys()):
+            journal, fy = key
+            first = JournalSequence.reserve(
+                count=len(pending[key]),
+                after=explicit[key],
+                journal_id=journal,
+                fiscal_year_id=fy
+            )
+            for number, txn in enumerate(pending[key], first):
+                txn.number = number
+                numbers[key + (number,)] += 1
+
+        if max(numbers.values(), default=0) > 1 or any(
+                row in numbers for row in self.model.objects.filter(
+                    journal__in={journal for journal, __, __ in numbers},
+                    fiscal_year__in={fy for __, fy, __ in numbers},
+                    number__in={number for __, __, number in numbers}
+                ).values_list('journal', 'fiscal_year', 'number')
+        ):
+            raise ValidationError('Duplicate transaction number')
+
+        new_lots = collections.defaultdict(list)
+        for txn, items in entries:
+            for item in items:
+                if item.account.lot_tracking and not item.lot_id:
+                    item.lot = Lot(
+                        account=item.account, fiscal_year=txn.fiscal_year
+                    )
+                    new_lots[(item.account_id, txn.fiscal_year_id)].append(
+                        item.lot
+                    )
+
+        for (account, fy), group in sorted(new_lots.items()):
+            first = LotSequence.reserve(
+                count=len(group), account_id=account, fiscal_year_id=fy
+            )
+            for number, lot in enumerate(group, first):
+                lot.number = number
+        bulk_insert(
+            Lot.objects, [lot for group in new_lots.values() for lot in group]
+        )
+
+        txns = bulk_insert(self, [txn for txn, __ in entries])
+
+        for txn, items in entries:
+            for item in items:
+                item.transaction = txn
+        TransactionItem.objects.bulk_create(all_items)
+
+        AccountPeriodBalance.post(all_items)
+        AccountDailyBalance.post(all_items)
+        if entries:
+            FiscalYear.touch(min(txn.date for txn, __ in entries))
+
+        return txns
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-16 20:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def rebuild_balances(apps, schema_editor):
+    AccountPeriodBalance = apps.get_model('accounting', 'AccountPeriodBalance')
+    TransactionItem = apps.get_model('accounting', 'TransactionItem')
+
+    balances = []
+    for row in TransactionItem.objects.filter(
+        transaction__state='C'
+    ).values('account', 'transaction__period', 'lot').annotate(
+        debit=models.Sum('amount', filter=models.Q(amount__lt=0)),
+        credit=models.Sum('amount', filter=models.Q(amount__gt=0))
+    ).order_by():
+        debit = -(row['debit'] or 0)
+        credit = row['credit'] or 0
+        balances.append(
+            AccountPeriodBalance(
+                account_id=row['account'],
+                period_id=row['transaction__period'],
+                lot_id=row['lot'],
+                debit=debit,
+                credit=credit,
+                net=credit - debit
+            )
+        )
+    AccountPeriodBalance.objects.bulk_create(balances)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0007_fiscalyear_properties'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountPeriodBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20)),
+                ('net', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20)),
+                ('account', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='period_balances', to='accounting.account')),
+                ('lot', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='period_balances', to='accounting.lot')),
+                ('period', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='account_balances', to='accounting.fiscalperiod')),
+            ],
+            options={
+                'unique_together': {('account', 'period', 'lot')},
+            },
+        ),
+        migrations.RunPython(rebuild_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-16 20:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def take_snapshots(apps, schema_editor):
+    ClosingBalance = apps.get_model('accounting', 'ClosingBalance')
+    FiscalYear = apps.get_model('accounting', 'FiscalYear')
+    TransactionItem = apps.get_model('accounting', 'TransactionItem')
+
+    for fy in FiscalYear.objects.filter(closed=True).order_by('end'):
+        if FiscalYear.objects.filter(closed=False, start__lt=fy.end).exists():
+            break
+
+        snapshots = []
+        for row in TransactionItem.objects.filter(
+            transaction__state='C', transaction__date__lte=fy.end
+        ).values('account', 'lot').annotate(
+            balance=models.Sum(
+                'amount',
+                filter=models.Q(transaction__date__lt=fy.end) |
+                models.Q(transaction__closing=False)
+            ),
+            after=models.Sum('amount')
+        ).order_by():
+            balance = row['balance'] or 0
+            if balance or row['after']:
+                snapshots.append(
+                    ClosingBalance(
+                        fiscal_year=fy,
+                        account_id=row['account'],
+                        lot_id=row['lot'],
+                        balance=balance,
+                        closing=row['after'] - balance
+                    )
+                )
+        ClosingBalance.objects.bulk_create(snapshots)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0008_accountperiodbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClosingBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, editable=False, max_digits=20)),
+                ('closing', models.DecimalField(decimal_places=2, editable=False, max_digits=20)),
+                ('account', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='closing_balances', to='accounting.account')),
+                ('fiscal_year', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='closing_balances', to='accounting.fiscalyear')),
+                ('lot', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='closing_balances', to='accounting.lot')),
+            ],
+            options={
+                'unique_together': {('fiscal_year', 'account', 'lot')},
+            },
+        ),
+        migrations.RunPython(take_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0009_closingbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JournalSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last', models.IntegerField(default=0, editable=False)),
+                ('fiscal_year', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='journal_sequences', to='accounting.fiscalyear')),
+                ('journal', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='sequences', to='accounting.journal')),
+            ],
+            options={
+                'unique_together': {('journal', 'fiscal_year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LotSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last', models.IntegerField(default=0, editable=False)),
+                ('account', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='lot_sequences', to='accounting.account')),
+                ('fiscal_year', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='lot_sequences', to='accounting.fiscalyear')),
+            ],
+            options={
+                'unique_together': {('account', 'fiscal_year')},
+            },
+        ),
+    ]
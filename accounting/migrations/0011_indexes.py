@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-16 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0010_sequences'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['state', 'date', 'closing'], name='accounting__state_eb4898_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['state', 'period'], name='accounting__state_06db56_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionitem',
+            index=models.Index(fields=['account', 'transaction', 'amount'], name='accounting__account_134c84_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionitem',
+            index=models.Index(fields=['lot', 'transaction', 'amount'], name='accounting__lot_id_9ee766_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0011_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fiscalyear',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='fiscalyear',
+            name='modified',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def rebuild_balances(apps, schema_editor):
+    AccountDailyBalance = apps.get_model('accounting', 'AccountDailyBalance')
+    TransactionItem = apps.get_model('accounting', 'TransactionItem')
+
+    AccountDailyBalance.objects.bulk_create(
+        AccountDailyBalance(
+            account_id=row['account'],
+            period_id=row['transaction__period'],
+            lot_id=row['lot'],
+            date=row['transaction__date'],
+            net=row['net'] or 0,
+            closing=row['closing'] or 0
+        )
+        for row in TransactionItem.objects.filter(
+            transaction__state='C'
+        ).values(
+            'account', 'lot', 'transaction__date', 'transaction__period'
+        ).annotate(
+            net=models.Sum(
+                'amount', filter=models.Q(transaction__closing=False)
+            ),
+            closing=models.Sum(
+                'amount', filter=models.Q(transaction__closing=True)
+            )
+        ).order_by()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0012_fiscalyear_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDailyBalance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(editable=False)),
+                ('net', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20)),
+                ('closing', models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=20)),
+                ('account', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='daily_balances', to='accounting.account')),
+                ('lot', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='daily_balances', to='accounting.lot')),
+                ('period', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='account_daily_balances', to='accounting.fiscalperiod')),
+            ],
+            options={
+                'unique_together': {('account', 'lot', 'date')},
+            },
+        ),
+        migrations.RunPython(rebuild_balances, migrations.RunPython.noop),
+    ]
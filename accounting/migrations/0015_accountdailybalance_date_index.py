@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0014_cacheversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accountdailybalance',
+            index=models.Index(fields=['date'], name='accounting__date_759420_idx'),
+        ),
+    ]
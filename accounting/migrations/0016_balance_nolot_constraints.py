@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Merges the balance rows without a lot that concurrent postings may have
+    duplicated before the constraints existed.
+    """
+    for name, key, amounts in (
+            ('AccountPeriodBalance', ('account', 'period'),
+             ('debit', 'credit', 'net')),
+            ('AccountDailyBalance', ('account', 'date'), ('net', 'closing'))
+    ):
+        model = apps.get_model('accounting', name)
+        rows = model.objects.filter(lot=None)
+        for dup in rows.values(*key).annotate(
+                count=models.Count('pk'),
+                **{f'total_{f}': models.Sum(f) for f in amounts}
+        ).filter(count__gt=1).order_by():
+            group = rows.filter(**{k: dup[k] for k in key}).order_by('pk')
+            first = group[0].pk
+            group.exclude(pk=first).delete()
+            model.objects.filter(pk=first).update(
+                **{f: dup[f'total_{f}'] for f in amounts}
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0015_accountdailybalance_date_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='accountdailybalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('lot', None)), fields=('account', 'date'), name='accounting_dailybalance_nolot'),
+        ),
+        migrations.AddConstraint(
+            model_name='accountperiodbalance',
+            constraint=models.UniqueConstraint(condition=models.Q(('lot', None)), fields=('account', 'period'), name='accounting_periodbalance_nolot'),
+        ),
+    ]
@@ -1,34 +1,181 @@
-# Copyright (c) 2015-2024 Data King Ltd
+# Copyright (c) 2015-2026 Data King Ltd
 # See LICENSE file for license details
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.signals import request_started
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.db.transaction import atomic, on_commit
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext as _
 from mptt.models import MPTTModel, TreeForeignKey
 
+import bisect
 import collections
 import datetime
 from decimal import Decimal as D
 import functools
+import itertools
 import operator
+import threading
 import time
 
-from . import display, managers
+from . import display, ledger, managers
+
+
+class Calendar:
+    """
+    Index of date ranges sorted by start date and searched by bisection.
+    """
+
+    def __init__(self, ranges):
+        self.ranges = sorted(ranges, key=operator.attrgetter('start'))
+        self.starts = [rng.start for rng in self.ranges]
+        self.ends = [rng.end for rng in self.ranges]
+
+    def find(self, date):
+        i = bisect.bisect_right(self.starts, date)
+        return [
+            rng for rng in self.ranges[max(i - 2, 0):i] if rng.end >= date
+        ]
+
+    def ending(self, start, end):
+        return self.ranges[
+            bisect.bisect_left(self.ends, start):
+            bisect.bisect_right(self.ends, end)
+        ]
+
+
+class CacheVersion(models.Model):
+    """
+    Version of the data behind a process-wide cache, incremented whenever
+    the data changes, so that other processes can detect stale caches.
+    """
+
+    name = models.CharField(max_length=16, unique=True)
+    version = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def get(name):
+        return CacheVersion.objects.filter(name=name).values_list(
+            'version', flat=True
+        ).first() or 0
+
+    @staticmethod
+    def bump(name):
+        def update():
+            if not CacheVersion.objects.filter(name=name).update(
+                    version=models.F('version') + 1
+            ):
+                CacheVersion.objects.get_or_create(
+                    name=name, defaults={'version': 1}
+                )
+        on_commit(update)
+
+    def __str__(self):
+        return self.name
+
+
+class ProcessCache:
+    """
+    Process-wide cache of a value loaded from the database.
+
+    The value is dropped when its data is changed in this process. Changes
+    made by other processes are detected by comparing the version of the
+    value with the CacheVersion, which each thread reads at most once per
+    request, or once per ACCOUNTING_CACHE_CHECK_INTERVAL seconds outside
+    requests. Another source of the version may be given as get_version.
+    """
+
+    instances = []
+
+    def __init__(self, name, load, get_version=None):
+        self.name = name
+        self.load = load
+        self.get_version = get_version or (lambda: CacheVersion.get(name))
+        self.value = None
+        self.version = None
+        self.local = threading.local()
+        ProcessCache.instances.append(self)
+
+    def is_checked(self):
+        checked = getattr(self.local, 'checked', None)
+        return checked is not None and time.monotonic() - checked < getattr(
+            settings, 'ACCOUNTING_CACHE_CHECK_INTERVAL', 1
+        )
+
+    def get(self, reload=False):
+        value = self.value
+        if value is not None and not reload and self.is_checked():
+            return value
+
+        version = self.get_version()
+        self.local.checked = time.monotonic()
+        if value is None or reload or version != self.version:
+            value = self.load(version)
+            self.value, self.version = value, version
+        return value
+
+    def drop(self):
+        self.value = None
+
+    def invalidate(self):
+        self.drop()
+        CacheVersion.bump(self.name)
+
+    @staticmethod
+    def reset_checks():
+        for cache in ProcessCache.instances:
+            cache.local.checked = None
 
 
 class DateRange(models.Model):
     start = models.DateField()
     end = models.DateField()
 
+    _calendars = {}
+
+    @classmethod
+    def get_ranges(cls):
+        return cls.objects.all()
+
+    @classmethod
+    def get_calendar(cls, reload=False):
+        """
+        Returns the process-wide index of the ranges of this model.
+
+        The index is dropped whenever a fiscal year or period is saved or
+        deleted in this process, and reloaded when the calendar version
+        shows a change by another process. Ranges created by other
+        processes are also picked up by reloading it when a lookup misses.
+        """
+        cache = DateRange._calendars.get(cls)
+        if cache is None:
+            cache = DateRange._calendars.setdefault(
+                cls,
+                ProcessCache(
+                    'calendar', lambda version: Calendar(cls.get_ranges())
+                )
+            )
+        return cache.get(reload)
+
+    @staticmethod
+    def invalidate_calendars():
+        for cache in list(DateRange._calendars.values()):
+            cache.drop()
+        CacheVersion.bump('calendar')
+
     @classmethod
     def by_date(cls, date):
-        ranges = cls.objects.filter(start__lte=date, end__gte=date).all()
-        if not ranges:
-            return cls.generate(date)
-        if len(ranges) > 1:
-            raise cls.MultipleObjectsReturned
-        return ranges[0]
+        for reload in (False, True):
+            ranges = cls.get_calendar(reload).find(date)
+            if len(ranges) > 1:
+                raise cls.MultipleObjectsReturned
+            if ranges:
+                return ranges[0]
+        return cls.generate(date)
 
     class Meta:
         abstract = True
@@ -38,9 +185,46 @@ class DateRange(models.Model):
         return self.end < rng.end
 
 
+class Sequence(models.Model):
+    last = models.IntegerField(default=0, editable=False)
+
+    @classmethod
+    def get_last(cls, **key):
+        raise NotImplementedError
+
+    @classmethod
+    @managers.atomic_write
+    def reserve(cls, count=1, after=0, **key):
+        """
+        Reserves a block of count consecutive numbers greater than after and
+        returns the first one.
+
+        The sequence row is locked until the end of the enclosing database
+        transaction, so concurrent committers are served one at a time
+        instead of racing for the same number. A missing row is seeded from
+        the numbers already in use.
+        """
+        try:
+            seq = cls.objects.select_for_update().get(**key)
+        except cls.DoesNotExist:
+            seq, __ = cls.objects.select_for_update().get_or_create(
+                defaults={'last': cls.get_last(**key)}, **key
+            )
+        first = max(seq.last, after) + 1
+        if first + count - 1 > seq.last:
+            seq.last = first + count - 1
+            seq.save(update_fields=('last',))
+        return first
+
+    class Meta:
+        abstract = True
+
+
 class FiscalYear(DateRange):
     closed = models.BooleanField(default=False, editable=False)
     properties = models.JSONField(blank=True, null=True)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    modified = models.DateTimeField(blank=True, null=True, editable=False)
 
     @classmethod
     def generate(cls, date):
@@ -60,10 +244,66 @@ class FiscalYear(DateRange):
             latest = FiscalYear.objects.create(start=start, end=end)
         return latest
 
+    @staticmethod
+    def touch(date=None):
+        """
+        Bumps the versions of the fiscal years ending on or after the given
+        date, or of all fiscal years if no date is given, once the current
+        database transaction is committed.
+
+        Reports of a fiscal year depend on the balances carried over from
+        the preceding years, so a change on a date invalidates the reports
+        of all the fiscal years after it, but not those before it. The
+        ledger snapshot of this process is dropped at the same time.
+        """
+        fyears = FiscalYear.objects.all()
+        if date:
+            fyears = fyears.filter(end__gte=date)
+
+        def update():
+            fyears.update(
+                version=models.F('version') + 1, modified=timezone.now()
+            )
+            ledger.Ledger.invalidate()
+        on_commit(update)
+
+    def save(self, **kwargs):
+        # The version and the time of the latest change are only updated by
+        # touch, so that saving a stale instance cannot roll them back
+        if not self._state.adding and not kwargs.get('force_insert') and \
+           kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.name not in ('version', 'modified')
+            ]
+        super().save(**kwargs)
+        FiscalYear.touch(self.start)
+
+    @staticmethod
+    def by_label(label):
+        try:
+            year = int(label)
+            i = 0
+        except ValueError:
+            year = int(label[:-1])
+            i = ord(label[-1]) - 64
+
+        for reload in (False, True):
+            fyears = FiscalYear.get_calendar(reload).ending(
+                datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+            )
+            if 0 <= i < len(fyears):
+                return fyears[i]
+        raise FiscalYear.DoesNotExist
+
     def __str__(self):
-        i = FiscalYear.objects.filter(
-            end__gte=datetime.date(self.end.year, 1, 1), end__lt=self.end
-        ).count()
+        i = len(
+            FiscalYear.get_calendar().ending(
+                datetime.date(self.end.year, 1, 1),
+                self.end - datetime.timedelta(days=1)
+            )
+        )
         return str(self.end.year) + (chr(64 + i) if i else '')
     __str__.short_description = 'Fiscal year'
 
@@ -71,45 +311,63 @@ class FiscalYear(DateRange):
     def transactions(self):
         return self.transaction_set.filter(state='C')
 
+    @managers.atomic_write
     def close(self):
         if self.closed:
             raise ValidationError(f'Fiscal year {self} already closed')
 
-        txn = None
-        profit = 0
-
-        for account in Account.objects.all():
-            if not account.is_pl_account:
-                continue
-            balance = account.get_balance(date=self.end)
-            if not balance:
-                continue
-            if not txn:
-                txn = Transaction.objects.create(
-                    journal=Journal.get_closing(),
-                    date=self.end,
-                    description=_(
-                        'Net earnings during fiscal year {}'
-                    ).format(self),
-                    closing=True
-                )
-            txn.items.create(account=account, amount=-balance)
-            profit += balance
+        items = [
+            TransactionItem(account_id=account, amount=-balances['own'][0])
+            for (__, __, account), balances in sorted(
+                TransactionItem.get_total_balances(
+                    (self.end,),
+                    ('account__tree_id', 'account__lft', 'account'),
+                    own=models.Q(account__type__in=Account.TYPES_PL)
+                ).items()
+            )
+            if balances['own'][0]
+        ]
 
-        if txn:
+        if items:
+            profit = -sum(item.amount for item in items)
             if profit:
-                txn.items.create(
-                    account=Account.objects.get(type='NE'), amount=profit
+                items.append(
+                    TransactionItem(
+                        account=Account.objects.get(type='NE'), amount=profit
+                    )
                 )
-            txn.commit()
+            Transaction.objects.post_many((
+                (
+                    Transaction(
+                        journal=Journal.get_closing(),
+                        date=self.end,
+                        description=_(
+                            'Net earnings during fiscal year {}'
+                        ).format(self),
+                        closing=True
+                    ),
+                    items
+                ),
+            ))
 
         self.closed = True
-        self.save()
+        self.save(update_fields=('closed',))
+
+        ClosingBalance.take_snapshots()
 
 
 class FiscalPeriod(DateRange):
     fiscal_year = models.ForeignKey(FiscalYear, on_delete=models.PROTECT)
 
+    @classmethod
+    def get_ranges(cls):
+        fyears = {fy.pk: fy for fy in FiscalYear.get_calendar().ranges}
+        periods = list(cls.objects.all())
+        for period in periods:
+            period.fiscal_year = fyears.get(period.fiscal_year_id) or \
+                period.fiscal_year
+        return periods
+
     @classmethod
     def generate(cls, date):
         start = datetime.date(date.year, date.month, 1)
@@ -133,6 +391,137 @@ class FiscalPeriod(DateRange):
 
 
 
+class AccountNode:
+    """
+    Immutable record of an account in the account tree snapshot, with the
+    primary keys of its parent and children.
+    """
+
+    __slots__ = (
+        'pk',
+        'code',
+        'name',
+        'order',
+        'type',
+        'public',
+        'frozen',
+        'lot_tracking',
+        'tree_id',
+        'lft',
+        'rght',
+        'level',
+        'parent',
+        'children'
+    )
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            object.__setattr__(self, name, kwargs[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Account nodes are immutable')
+
+    @property
+    def is_pl_account(self):
+        return self.type in Account.TYPES_PL
+
+    @property
+    def title(self):
+        return ((self.code + ' ') if self.code else '') + self.name
+
+    @property
+    def sign(self):
+        return -1 if self.type in ('As', 'Ex') else 1
+
+    def get_account(self):
+        """
+        Returns a new Account instance with the fields of the node.
+        """
+        account = Account(
+            parent_id=self.parent,
+            **{name: getattr(self, name) for name in AccountTree.fields[:-1]}
+        )
+        account._state.adding = False
+        account._state.db = Account.objects.db
+        return account
+
+    def __str__(self):
+        return self.title
+
+
+class AccountTree:
+    """
+    Snapshot of the chart of accounts as nodes in tree order.
+    """
+
+    fields = (
+        'pk',
+        'code',
+        'name',
+        'order',
+        'type',
+        'public',
+        'frozen',
+        'lot_tracking',
+        'tree_id',
+        'lft',
+        'rght',
+        'level',
+        'parent_id'
+    )
+
+    def __init__(self, rows, version=0):
+        self.version = version
+        rows = sorted(rows, key=operator.itemgetter(8, 9))
+
+        children = collections.defaultdict(list)
+        for row in rows:
+            children[row[-1]].append(row[0])
+
+        self.ordered = tuple(
+            AccountNode(
+                parent=row[-1],
+                children=tuple(children[row[0]]),
+                **dict(zip(self.fields[:-1], row[:-1]))
+            )
+            for row in rows
+        )
+        self.nodes = {node.pk: node for node in self.ordered}
+        self.keys = [(node.tree_id, node.lft) for node in self.ordered]
+
+    def __getitem__(self, pk):
+        return self.nodes[pk]
+
+    def get_ancestors(self, node):
+        res = []
+        while node.parent:
+            node = self.nodes[node.parent]
+            res.append(node)
+        return res
+
+    def get_descendants(self, node, include_self=False):
+        """
+        Returns the nodes in the subtree of the given node or account.
+        """
+        return self.ordered[
+            bisect.bisect_left(self.keys, (node.tree_id, node.lft)) +
+            (0 if include_self else 1):
+            bisect.bisect_right(self.keys, (node.tree_id, node.rght))
+        ]
+
+    def get_accounts(self):
+        """
+        Returns new Account instances of all nodes keyed by primary key, in
+        tree order and with their parents cached.
+        """
+        res = {node.pk: node.get_account() for node in self.ordered}
+        for account in res.values():
+            Account.parent.field.set_cached_value(
+                account, res.get(account.parent_id)
+            )
+        return res
+
+
 class Account(MPTTModel):
     name = models.CharField(max_length=64)
     code = models.CharField(max_length=8, blank=True)
@@ -166,6 +555,37 @@ class Account(MPTTModel):
     pl_accounts = managers.AccountManager(*TYPES_PL)
     equity_accounts = managers.AccountManager('Eq', 'NE')
 
+    _tree = ProcessCache(
+        'accounts',
+        lambda version: AccountTree(
+            Account.objects.values_list(*AccountTree.fields), version
+        )
+    )
+
+    @classmethod
+    def get_tree(cls, reload=False):
+        """
+        Returns the process-wide snapshot of the chart of accounts, with the
+        CacheVersion of the accounts as its version.
+        """
+        return Account._tree.get(reload)
+
+    @staticmethod
+    def invalidate_tree():
+        Account._tree.invalidate()
+
+    @classmethod
+    def get_cached(cls, pk):
+        """
+        Returns a new instance of the account with the given primary key
+        from the tree snapshot.
+        """
+        for reload in (False, True):
+            node = cls.get_tree(reload).nodes.get(int(pk))
+            if node:
+                return node.get_account()
+        raise cls.DoesNotExist
+
     def clean(self):
         try:
             if self.code and Account.objects.get(code=self.code) != self:
@@ -235,6 +655,8 @@ class Account(MPTTModel):
         if parent_changed:
             update(old_parent)
 
+        FiscalYear.touch()
+
     @property
     def is_pl_account(self):
         return self.type in self.TYPES_PL
@@ -247,6 +669,15 @@ class Account(MPTTModel):
     def sign(self):
         return -1 if self.type in ('As', 'Ex') else 1
 
+    def get_subtree_filter(self, prefix='account__'):
+        return models.Q(
+            **{
+                prefix + 'tree_id': self.tree_id,
+                prefix + 'lft__gte': self.lft,
+                prefix + 'rght__lte': self.rght
+            }
+        )
+
     def get_balance(
         self,
         date=None,
@@ -254,35 +685,126 @@ class Account(MPTTModel):
         lot=None,
         transaction=None,
     ):
+        if not lot and not transaction:
+            try:
+                return self._balances[date, children]
+            except (AttributeError, KeyError):
+                pass
+
+        own = self.get_subtree_filter() if children else \
+            models.Q(account=self)
+        if lot:
+            own &= models.Q(lot=lot)
+
         if transaction == 'closing':
-            balance = 0
-        else:
-            items = self.items
-            if lot:
-                items = items.filter(lot=lot)
-            if transaction:
-                items = items.filter(transaction=transaction)
-            balance = TransactionItem.get_total_balance(items, date)
-
-        if not children:
-            return balance
-
-        if self.type == 'NE' and transaction in (None, 'closing'):
-            balance += TransactionItem.get_total_balance(
-                TransactionItem.objects.filter(account__type__in=self.TYPES_PL),
+            filters = {}
+        elif transaction:
+            return TransactionItem.get_total_balance(
+                TransactionItem.objects.filter(own, transaction=transaction),
                 date
             )
+        else:
+            filters = {'own': own}
 
-        return functools.reduce(
-            operator.add,
-            (
-                account.get_balance(
-                    date=date, children=True, lot=lot, transaction=transaction
-                )
-                for account in self.children.all()
-            ),
-            balance
-        )
+        if children and transaction in (None, 'closing') and any(
+                node.type == 'NE'
+                for node in Account.get_tree().get_descendants(self, True)
+        ):
+            filters['pl'] = models.Q(account__type__in=self.TYPES_PL)
+
+        if not filters:
+            return 0
+
+        if ledger.is_enabled() and not lot and not transaction:
+            return ledger.Ledger.load().get_balance(self.pk, date, children)
+
+        balances = TransactionItem.get_total_balances((date,), **filters)
+        return sum(b[0] for b in balances.get((), {}).values())
+
+    @classmethod
+    def load_balances(cls, accounts, dates, children=False):
+        """
+        Precomputes the balances of the given accounts as of the given dates.
+
+        The own balances of all accounts are fetched in one grouped query and
+        rolled up in memory along the tree, so that subsequent get_balance
+        calls with these arguments do not hit the database. With the
+        ACCOUNTING_LEDGER_SNAPSHOT setting, the balances are computed from
+        the in-memory ledger snapshot instead.
+        """
+        if not accounts:
+            return
+
+        dates = tuple(dates)
+
+        if ledger.is_enabled():
+            snapshot = ledger.Ledger.load()
+            balances = {False: snapshot.get_balances(dates)}
+            if children:
+                balances[True] = snapshot.get_balances(dates, True)
+            zero = [0] * len(dates)
+            for account in accounts:
+                if not hasattr(account, '_balances'):
+                    account._balances = {}
+                for key, values in balances.items():
+                    account._balances.update(
+                        ((date, key), b)
+                        for date, b in zip(dates, values.get(account.pk, zero))
+                    )
+            return
+
+        zero = [0] * len(dates)
+
+        def add(a, b):
+            return [x + y for x, y in zip(a, b)]
+
+        own = {}
+        pl = zero
+        for (tree_id, lft, type), balances in \
+            TransactionItem.get_total_balances(
+                dates,
+                ('account__tree_id', 'account__lft', 'account__type'),
+                own=models.Q()
+            ).items():
+
+            own[tree_id, lft] = balances['own']
+            if type in cls.TYPES_PL:
+                pl = add(pl, balances['own'])
+
+        if children:
+            nodes = sorted(own)
+            totals = [zero]
+            for node in nodes:
+                totals.append(add(totals[-1], own[node]))
+            ne = [
+                (node.tree_id, node.lft) for node in cls.get_tree().ordered
+                if node.type == 'NE'
+            ]
+
+        for account in accounts:
+            if not hasattr(account, '_balances'):
+                account._balances = {}
+
+            node = (account.tree_id, account.lft)
+            account._balances.update(
+                ((date, False), b)
+                for date, b in zip(dates, own.get(node, zero))
+            )
+            if not children:
+                continue
+
+            lo = bisect.bisect_left(nodes, node)
+            hi = bisect.bisect_right(nodes, (account.tree_id, account.rght))
+            balances = [h - l for h, l in zip(totals[hi], totals[lo])]
+            if any(
+                    tree_id == account.tree_id and
+                    account.lft <= lft <= account.rght
+                    for tree_id, lft in ne
+            ):
+                balances = add(balances, pl)
+            account._balances.update(
+                ((date, True), b) for date, b in zip(dates, balances)
+            )
 
     def get_balance_display(self):
         return display.currency(self.get_balance(children=True) * self.sign)
@@ -311,52 +833,40 @@ class Account(MPTTModel):
 
     @property
     def period_totals(self):
-        keys = {'debit': 'lt', 'credit': 'gt'}
-
-        class PeriodDict(collections.defaultdict):
-            def __missing__(self, period):
-                pt = {'period': period}
-                for key in keys:
-                    pt[key] = 0
-
-                self[period] = pt
-                return pt
-
-        totals = PeriodDict()
-
-        def update(key, comparison):
-            for period in FiscalPeriod.objects.filter(
-                models.Q(transaction__state='C') &
-                models.Q(transaction__item__account=self) &
-                models.Q(
-                    **{
-                        (
-                            'transaction__item__amount__' + comparison
-                        ): 0
-                    }
-                )
-            ).annotate(
-                models.Sum('transaction__item__amount')
-            ):
-                totals[period][key] = abs(
-                    TransactionItem.correct_sum(
-                        period.transaction__item__amount__sum
-                    )
+        if ledger.is_enabled():
+            totals = ledger.Ledger.load().get_period_totals(self.pk)
+            rows = (
+                (period, *totals[period.pk])
+                for period in FiscalPeriod.objects.filter(
+                    pk__in=totals
+                ).order_by('start')
+            )
+        else:
+            rows = (
+                (
+                    period,
+                    TransactionItem.correct_sum(period.debit) or 0,
+                    TransactionItem.correct_sum(period.credit) or 0
                 )
+                for period in FiscalPeriod.objects.filter(
+                    models.Q(account_balances__debit__gt=0) |
+                    models.Q(account_balances__credit__gt=0),
+                    self.get_subtree_filter('account_balances__account__')
+                ).annotate(
+                    debit=models.Sum('account_balances__debit'),
+                    credit=models.Sum('account_balances__credit')
+                ).order_by('start')
+            )
 
-        for key, comparison in keys.items():
-            update(key, comparison)
-
-        for child in self.children.all():
-            for cpt in child.period_totals:
-                pt = totals[cpt['period']]
-                for key in keys:
-                    pt[key] += cpt[key]
-
-        for pt in totals.values():
-            pt['balance'] = (pt['credit'] - pt['debit']) * self.sign
-
-        return list(totals.values())
+        return [
+            {
+                'period': period,
+                'debit': debit,
+                'credit': credit,
+                'balance': (credit - debit) * self.sign
+            }
+            for period, debit, credit in rows
+        ]
 
     class MPTTMeta:
         order_insertion_by = ('order',)
@@ -375,6 +885,8 @@ class Lot(models.Model):
     number = models.IntegerField(editable=False)
     description = models.CharField(max_length=128, blank=True)
 
+    objects = managers.LotQuerySet.as_manager()
+
     @property
     def title(self):
         return self.description or str(self)
@@ -389,14 +901,19 @@ class Lot(models.Model):
 
     def save(self, **kwargs):
         if not self.number:
-            self.number = (
-                Lot.objects.filter(
-                    account=self.account, fiscal_year=self.fiscal_year
-                ).aggregate(models.Max('number'))['number__max'] or 0
-            ) + 1
+            self.number = LotSequence.reserve(
+                account=self.account, fiscal_year=self.fiscal_year
+            )
         super().save(**kwargs)
+        FiscalYear.touch(self.fiscal_year.start)
 
     def get_balance(self, date=None, children=False):
+        try:
+            return self._balances[date]
+        except (AttributeError, KeyError):
+            pass
+        if date is None and hasattr(self, 'committed_balance'):
+            return TransactionItem.correct_sum(self.committed_balance) or 0
         return self.account.get_balance(date=date, lot=self)
 
     def get_balance_display(self):
@@ -416,6 +933,30 @@ class Lot(models.Model):
     __str__.short_description = 'lot'
 
 
+class LotSequence(Sequence):
+    account = models.ForeignKey(
+        Account,
+        editable=False,
+        on_delete=models.CASCADE,
+        related_name='lot_sequences'
+    )
+    fiscal_year = models.ForeignKey(
+        FiscalYear,
+        editable=False,
+        on_delete=models.CASCADE,
+        related_name='lot_sequences'
+    )
+
+    @classmethod
+    def get_last(cls, **key):
+        return Lot.objects.filter(**key).aggregate(
+            models.Max('number')
+        )['number__max'] or 0
+
+    class Meta:
+        unique_together = ('account', 'fiscal_year')
+
+
 
 class Journal(models.Model):
     code = models.CharField(max_length=8)
@@ -426,12 +967,14 @@ class Journal(models.Model):
     def get_closing():
         return Journal.objects.get(closing=True)
 
-    def issue_number(self, txn):
-        return (
-            self.transaction_set.filter(
-                fiscal_year=txn.fiscal_year
-            ).aggregate(models.Max('number'))['number__max'] or 0
-        ) + 1
+    def save(self, **kwargs):
+        super().save(**kwargs)
+        FiscalYear.touch()
+
+    def issue_number(self, txn, count=1):
+        return JournalSequence.reserve(
+            count=count, journal=self, fiscal_year=txn.fiscal_year
+        )
 
     @property
     def transactions(self):
@@ -444,6 +987,30 @@ class Journal(models.Model):
         return self.code
 
 
+class JournalSequence(Sequence):
+    journal = models.ForeignKey(
+        Journal,
+        editable=False,
+        on_delete=models.CASCADE,
+        related_name='sequences'
+    )
+    fiscal_year = models.ForeignKey(
+        FiscalYear,
+        editable=False,
+        on_delete=models.CASCADE,
+        related_name='journal_sequences'
+    )
+
+    @classmethod
+    def get_last(cls, **key):
+        return Transaction.objects.filter(**key).aggregate(
+            models.Max('number')
+        )['number__max'] or 0
+
+    class Meta:
+        unique_together = ('journal', 'fiscal_year')
+
+
 class Transaction(models.Model):
     fiscal_year = models.ForeignKey(
         FiscalYear,
@@ -471,14 +1038,19 @@ class Transaction(models.Model):
     )
     closing = models.BooleanField(default=False, editable=False)
 
+    objects = managers.TransactionQuerySet.as_manager()
+
     @property
     def balance(self):
+        if hasattr(self, 'item_total'):
+            return TransactionItem.correct_sum(self.item_total) or 0
         return TransactionItem.sum_amount(self.items)
 
     def get_balance_display(self):
         return display.currency(self.balance)
     get_balance_display.short_description = 'balance'
 
+    @managers.atomic_write
     def commit(self):
         if self.state != 'D':
             raise ValidationError(f'Transaction {self} already closed')
@@ -493,12 +1065,19 @@ class Transaction(models.Model):
             self.date = datetime.date.fromtimestamp(time.time())
         self.period = FiscalPeriod.by_date(self.date)
         self.fiscal_year = self.period.fiscal_year
+        self.fiscal_year.refresh_from_db(fields=('closed',))
         if self.fiscal_year.closed:
             raise ValidationError(
                 f'Fiscal year {self.fiscal_year} already closed'
             )
 
         if self.number:
+            JournalSequence.reserve(
+                count=0,
+                after=self.number,
+                journal=self.journal,
+                fiscal_year=self.fiscal_year
+            )
             if Transaction.objects.filter(
                     fiscal_year=self.fiscal_year,
                     journal=self.journal,
@@ -508,7 +1087,8 @@ class Transaction(models.Model):
         else:
             self.number = self.journal.issue_number(self)
 
-        for item in self.items.all():
+        items = self.items.all()
+        for item in items:
             if item.account.lot_tracking and not item.lot:
                 item.lot = Lot.objects.create(
                     account=item.account, fiscal_year=self.fiscal_year
@@ -519,9 +1099,17 @@ class Transaction(models.Model):
         self.state = 'C'
         self.save()
 
+        AccountPeriodBalance.post(items)
+        AccountDailyBalance.post(items)
+        FiscalYear.touch(self.date)
+
     class Meta:
         ordering = ('date', 'journal__code', 'number', 'id')
         unique_together = ('fiscal_year', 'journal', 'number')
+        indexes = (
+            models.Index(fields=('state', 'date', 'closing')),
+            models.Index(fields=('state', 'period')),
+        )
 
     def __str__(self):
         if self.state == 'C':
@@ -576,17 +1164,146 @@ class TransactionItem(models.Model):
         )
         return res if res else 0
 
+    @staticmethod
+    def date_filter(date, prefix='transaction__'):
+        if not date:
+            return models.Q()
+        return models.Q(**{prefix + 'date__lt': date}) | models.Q(
+            **{prefix + 'date': date, prefix + 'closing': False}
+        )
+
     @staticmethod
     def get_total_balance(items, date=None):
         items = items.filter(transaction__state='C')
         if date:
-            items = items.filter(
-                models.Q(transaction__date__lt=date) | (
-                    models.Q(transaction__date=date) &
-                    models.Q(transaction__closing=False)
+            items = items.filter(TransactionItem.date_filter(date))
+        return TransactionItem.sum_amount(items)
+
+    @staticmethod
+    def get_total_balances(dates, fields=(), **filters):
+        """
+        Computes committed balances as of several dates.
+
+        Each keyword argument is a Q object selecting the items of a named
+        bucket. Returns a dict mapping the values of the grouping fields to
+        dicts of per-date balance lists keyed by the bucket names. Buckets
+        with no matching items are omitted.
+
+        Each balance starts from the closing snapshot of the latest closed
+        fiscal year ending on or before the date. The fiscal periods
+        following the snapshot and ending before the date are summed from
+        the AccountPeriodBalance table, and the days of the period
+        containing the date from the AccountDailyBalance table.
+        """
+        def aggregate(queryset, date_filters):
+            queryset = queryset.filter(
+                functools.reduce(operator.or_, filters.values())
+            )
+            aggregates = {
+                f'{name}_{i}': models.Sum(amount, filter=q & date_filter)
+                for name, q in filters.items()
+                for i, (amount, date_filter) in date_filters.items()
+            }
+            if fields:
+                return queryset.values(*fields).annotate(
+                    **aggregates
+                ).order_by()
+            return (queryset.aggregate(**aggregates),)
+
+        snapshots = ClosingBalance.get_fiscal_years(dates)
+        rows = ()
+
+        if snapshots:
+            rows = aggregate(
+                ClosingBalance.objects.filter(
+                    fiscal_year__in=set(snapshots.values())
+                ),
+                {
+                    i: (
+                        models.F('balance') if fy.end == dates[i] else
+                        models.F('balance') + models.F('closing'),
+                        models.Q(fiscal_year=fy)
+                    )
+                    for i, fy in snapshots.items()
+                }
+            )
+
+        def after_snapshot(i, lookup):
+            return models.Q(**{lookup: snapshots[i].end}) \
+                if i in snapshots else models.Q()
+
+        periods = AccountPeriodBalance.objects
+        if None not in dates:
+            periods = periods.filter(period__end__lt=max(dates))
+            # With a snapshot for each date, only the periods after the
+            # earliest snapshot are read, by a search of the period index
+            if len(snapshots) == len(dates):
+                periods = periods.filter(
+                    period__in=FiscalPeriod.objects.filter(
+                        start__gt=min(fy.end for fy in snapshots.values()),
+                        end__lt=max(dates)
+                    )
                 )
+        rows = itertools.chain(
+            rows,
+            aggregate(
+                periods,
+                {
+                    i: (
+                        'net',
+                        models.Q(period__end__lt=date) &
+                        after_snapshot(i, 'period__start__gt')
+                    ) if date else ('net', models.Q())
+                    for i, date in enumerate(dates)
+                }
             )
-        return TransactionItem.sum_amount(items)
+        )
+
+        day_dates = {i: date for i, date in enumerate(dates) if date}
+        if day_dates:
+            days = AccountDailyBalance.objects.filter(
+                date__lte=max(day_dates.values()),
+                period__end__gte=min(day_dates.values())
+            )
+
+            # The days of the period containing the earliest date are bounded
+            # by its start too, so that they are found by the date index
+            first = FiscalPeriod.get_calendar().find(min(day_dates.values()))
+            if first:
+                days = days.filter(date__gte=first[0].start)
+
+            rows = itertools.chain(
+                rows,
+                aggregate(
+                    days,
+                    {
+                        i: (
+                            models.F('net') + models.Case(
+                                models.When(date__lt=date, then='closing'),
+                                default=0,
+                                output_field=models.DecimalField()
+                            ),
+                            models.Q(date__lte=date, period__end__gte=date) &
+                            after_snapshot(i, 'date__gt')
+                        )
+                        for i, date in day_dates.items()
+                    }
+                )
+            )
+
+        res = {}
+        for row in rows:
+            key = tuple(row[f] for f in fields)
+            for name in filters:
+                sums = [row.get(f'{name}_{i}') for i in range(len(dates))]
+                if all(s is None for s in sums):
+                    continue
+                balances = res.setdefault(key, {}).setdefault(
+                    name, [0] * len(dates)
+                )
+                for i, s in enumerate(sums):
+                    balances[i] += TransactionItem.correct_sum(s) or 0
+        return res
 
     @property
     def debit(self):
@@ -608,5 +1325,397 @@ class TransactionItem(models.Model):
         if self.lot and self.lot.account != self.account:
             raise ValidationError('Lot does not match the account')
 
+    class Meta:
+        indexes = (
+            models.Index(fields=('account', 'transaction', 'amount')),
+            models.Index(fields=('lot', 'transaction', 'amount')),
+        )
+
     def __str__(self):
         return ''
+
+
+class AccountPeriodBalance(models.Model):
+    account = models.ForeignKey(
+        Account,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='period_balances'
+    )
+    period = models.ForeignKey(
+        FiscalPeriod,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='account_balances'
+    )
+    lot = models.ForeignKey(
+        Lot,
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='period_balances'
+    )
+    debit = models.DecimalField(
+        max_digits=20, decimal_places=2, default=0, editable=False
+    )
+    credit = models.DecimalField(
+        max_digits=20, decimal_places=2, default=0, editable=False
+    )
+    net = models.DecimalField(
+        max_digits=20, decimal_places=2, default=0, editable=False
+    )
+
+    @staticmethod
+    def get_totals(items):
+        totals = collections.defaultdict(lambda: [0, 0])
+        for item in items:
+            key = (item.account_id, item.transaction.period_id, item.lot_id)
+            if item.amount < 0:
+                totals[key][0] -= item.amount
+            else:
+                totals[key][1] += item.amount
+        return totals
+
+    @classmethod
+    def post(cls, items):
+        totals = cls.get_totals(items)
+        if not totals:
+            return
+
+        def lock(keys):
+            return {
+                (balance.account_id, balance.period_id, balance.lot_id):
+                balance
+                for balance in cls.objects.select_for_update().filter(
+                    account__in={account for account, __, __ in keys},
+                    period__in={period for __, period, __ in keys}
+                ).order_by('pk')
+            }
+
+        # Missing rows are inserted empty and locked like the others, as a
+        # concurrent posting to the same account may be inserting them too.
+        # Rows are locked and inserted in a fixed order, so that concurrent
+        # postings wait for each other instead of deadlocking.
+        balances = lock(totals)
+        missing = sorted(
+            totals.keys() - balances.keys(),
+            key=lambda key: (key[0], key[1], key[2] or 0)
+        )
+        if missing:
+            cls.objects.bulk_create(
+                [
+                    cls(account_id=account, period_id=period, lot_id=lot)
+                    for account, period, lot in missing
+                ],
+                ignore_conflicts=True
+            )
+            balances.update(lock(missing))
+
+        updated = []
+        for key, (debit, credit) in totals.items():
+            balance = balances[key]
+            balance.debit += debit
+            balance.credit += credit
+            balance.net += credit - debit
+            updated.append(balance)
+        cls.objects.bulk_update(updated, ('debit', 'credit', 'net'))
+
+    @classmethod
+    @atomic
+    def rebuild(cls):
+        cls.objects.all().delete()
+
+        balances = []
+        for row in TransactionItem.objects.filter(
+            transaction__state='C'
+        ).values('account', 'transaction__period', 'lot').annotate(
+            debit=models.Sum('amount', filter=models.Q(amount__lt=0)),
+            credit=models.Sum('amount', filter=models.Q(amount__gt=0))
+        ).order_by():
+            debit = -(TransactionItem.correct_sum(row['debit']) or 0)
+            credit = TransactionItem.correct_sum(row['credit']) or 0
+            balances.append(
+                cls(
+                    account_id=row['account'],
+                    period_id=row['transaction__period'],
+                    lot_id=row['lot'],
+                    debit=debit,
+                    credit=credit,
+                    net=credit - debit
+                )
+            )
+        cls.objects.bulk_create(balances)
+
+    class Meta:
+        unique_together = ('account', 'period', 'lot')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('account', 'period'),
+                condition=models.Q(lot=None),
+                name='accounting_periodbalance_nolot'
+            ),
+        )
+
+
+class AccountDailyBalance(models.Model):
+    account = models.ForeignKey(
+        Account,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='daily_balances'
+    )
+    period = models.ForeignKey(
+        FiscalPeriod,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='account_daily_balances'
+    )
+    lot = models.ForeignKey(
+        Lot,
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='daily_balances'
+    )
+    date = models.DateField(editable=False)
+    net = models.DecimalField(
+        max_digits=20, decimal_places=2, default=0, editable=False
+    )
+    closing = models.DecimalField(
+        max_digits=20, decimal_places=2, default=0, editable=False
+    )
+
+    @staticmethod
+    def get_totals(items):
+        totals = collections.defaultdict(lambda: [0, 0])
+        for item in items:
+            txn = item.transaction
+            key = (item.account_id, item.lot_id, txn.date, txn.period_id)
+            totals[key][1 if txn.closing else 0] += item.amount
+        return totals
+
+    @classmethod
+    def post(cls, items):
+        totals = cls.get_totals(items)
+        if not totals:
+            return
+
+        def lock(keys):
+            return {
+                (balance.account_id, balance.lot_id, balance.date): balance
+                for balance in cls.objects.select_for_update().filter(
+                    account__in={account for account, __, __, __ in keys},
+                    date__in={date for __, __, date, __ in keys}
+                ).order_by('pk')
+            }
+
+        # Missing rows are inserted empty and locked like the others, in a
+        # fixed order, as in AccountPeriodBalance.post
+        balances = lock(totals)
+        missing = sorted(
+            (key for key in totals if key[:3] not in balances),
+            key=lambda key: (key[0], key[1] or 0, key[2])
+        )
+        if missing:
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        account_id=account,
+                        period_id=period,
+                        lot_id=lot,
+                        date=date
+                    )
+                    for account, lot, date, period in missing
+                ],
+                ignore_conflicts=True
+            )
+            balances.update(lock(missing))
+
+        updated = []
+        for (account, lot, date, __), (net, closing) in totals.items():
+            balance = balances[(account, lot, date)]
+            balance.net += net
+            balance.closing += closing
+            updated.append(balance)
+        cls.objects.bulk_update(updated, ('net', 'closing'))
+
+    @classmethod
+    @atomic
+    def rebuild(cls):
+        cls.objects.all().delete()
+
+        cls.objects.bulk_create(
+            cls(
+                account_id=row['account'],
+                period_id=row['transaction__period'],
+                lot_id=row['lot'],
+                date=row['transaction__date'],
+                net=TransactionItem.correct_sum(row['net']) or 0,
+                closing=TransactionItem.correct_sum(row['closing']) or 0
+            )
+            for row in TransactionItem.objects.filter(
+                transaction__state='C'
+            ).values(
+                'account', 'lot', 'transaction__date', 'transaction__period'
+            ).annotate(
+                net=models.Sum(
+                    'amount', filter=models.Q(transaction__closing=False)
+                ),
+                closing=models.Sum(
+                    'amount', filter=models.Q(transaction__closing=True)
+                )
+            ).order_by()
+        )
+
+    class Meta:
+        unique_together = ('account', 'lot', 'date')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('account', 'date'),
+                condition=models.Q(lot=None),
+                name='accounting_dailybalance_nolot'
+            ),
+        )
+        indexes = (models.Index(fields=('date',)),)
+
+
+class ClosingBalance(models.Model):
+    fiscal_year = models.ForeignKey(
+        FiscalYear,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='closing_balances'
+    )
+    account = models.ForeignKey(
+        Account,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='closing_balances'
+    )
+    lot = models.ForeignKey(
+        Lot,
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.PROTECT,
+        related_name='closing_balances'
+    )
+    balance = models.DecimalField(
+        max_digits=20, decimal_places=2, editable=False
+    )
+    closing = models.DecimalField(
+        max_digits=20, decimal_places=2, editable=False
+    )
+
+    @staticmethod
+    def get_snapshot_years():
+        return FiscalYear.objects.filter(closed=True).exclude(
+            models.Exists(
+                FiscalYear.objects.filter(
+                    closed=False, start__lt=models.OuterRef('end')
+                )
+            )
+        ).order_by('end')
+
+    @staticmethod
+    def get_fiscal_years(dates):
+        """
+        Maps the indices of the given dates to the latest fiscal years with
+        a closing snapshot ending on or before the respective dates.
+
+        Snapshots are taken only for closed fiscal years not preceded by any
+        open fiscal year, as the books may still change before that point.
+        """
+        dated = {i: date for i, date in enumerate(dates) if date}
+        if not dated:
+            return {}
+
+        fyears = list(
+            ClosingBalance.get_snapshot_years().filter(
+                models.Exists(
+                    ClosingBalance.objects.filter(
+                        fiscal_year=models.OuterRef('pk')
+                    )
+                ),
+                end__lte=max(dated.values())
+            )
+        )
+        ends = [fy.end for fy in fyears]
+
+        res = {}
+        for i, date in dated.items():
+            j = bisect.bisect_right(ends, date)
+            if j:
+                res[i] = fyears[j - 1]
+        return res
+
+    @classmethod
+    def take_snapshots(cls):
+        for fy in cls.get_snapshot_years().exclude(
+            models.Exists(cls.objects.filter(fiscal_year=models.OuterRef('pk')))
+        ):
+            balances = {
+                key: balances['own'][0]
+                for key, balances in TransactionItem.get_total_balances(
+                    (fy.end,), ('account', 'lot'), own=models.Q()
+                ).items()
+            }
+
+            # Only the closing transactions dated on the last day belong to
+            # the fiscal year but are excluded from its closing balance
+            closing = {
+                (row['account'], row['lot']): TransactionItem.correct_sum(
+                    row['amount__sum']
+                )
+                for row in TransactionItem.objects.filter(
+                    transaction__state='C',
+                    transaction__date=fy.end,
+                    transaction__closing=True
+                ).values('account', 'lot').annotate(
+                    models.Sum('amount')
+                ).order_by()
+            }
+
+            snapshots = []
+            for account, lot in balances.keys() | closing.keys():
+                balance = balances.get((account, lot), 0)
+                after = balance + closing.get((account, lot), 0)
+                if balance or after:
+                    snapshots.append(
+                        cls(
+                            fiscal_year=fy,
+                            account_id=account,
+                            lot_id=lot,
+                            balance=balance,
+                            closing=after - balance
+                        )
+                    )
+            cls.objects.bulk_create(snapshots)
+
+    class Meta:
+        unique_together = ('fiscal_year', 'account', 'lot')
+
+
+@receiver((post_save, post_delete), sender=Account)
+def invalidate_tree(sender, **kwargs):
+    Account.invalidate_tree()
+
+
+@receiver(post_delete, sender=Account)
+@receiver(post_delete, sender=Journal)
+@receiver(post_delete, sender=Lot)
+def touch_fiscal_years(sender, **kwargs):
+    FiscalYear.touch()
+
+
+@receiver(request_started)
+def reset_cache_checks(sender, **kwargs):
+    ProcessCache.reset_checks()
+
+
+@receiver((post_save, post_delete), sender=FiscalYear)
+@receiver((post_save, post_delete), sender=FiscalPeriod)
+def invalidate_calendars(sender, **kwargs):
+    DateRange.invalidate_calendars()
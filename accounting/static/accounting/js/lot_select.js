@@ -0,0 +1,43 @@
+// Copyright (c) 2026 Data King Ltd
+// See LICENSE file for license details
+
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Searches the lots of the account chosen in the same row
+    function init(index, element) {
+        const $lot = $(element);
+        const $target = $lot.closest('tr').find('select[name$="-target"]');
+        const accounts = ($lot.attr('data-accounts') || '').split(' ');
+
+        function update() {
+            $lot.prop('disabled', !accounts.includes($target.val()));
+        }
+
+        $lot.select2({
+            allowClear: true,
+            placeholder: '',
+            width: 'style',
+            ajax: {
+                url: () => $lot.attr('data-url').replace(/0$/, $target.val()),
+                dataType: 'json',
+                delay: 250,
+                data: (params) => ({q: params.term})
+            }
+        });
+        $target.on('change', () => {
+            $lot.val(null).trigger('change');
+            update();
+        });
+        update();
+    }
+
+    $(function() {
+        $('.lot-select').not('[name*=__prefix__]').each(init);
+    });
+
+    $(document).on('formset:added', (event, $row) => {
+        ($row || $(event.target)).find('.lot-select').each(init);
+    });
+}
@@ -1,7 +1,8 @@
-# Copyright (c) 2015-2024 Data King Ltd
+# Copyright (c) 2015-2026 Data King Ltd
 # See LICENSE file for license details
 
 from django import template
+from django.db.models import Q, QuerySet, Sum
 from django.utils.formats import date_format
 from django.utils.html import format_html, mark_safe
 from django.utils.translation import gettext as _
@@ -10,9 +11,13 @@ from mptt.utils import previous_current_next
 
 from collections.abc import Iterable
 from datetime import timedelta
+from functools import reduce
 from itertools import count
+from operator import or_
 
-from .. import display
+from .. import display, ledger
+from ..instrumentation import instrumented
+from ..models import Account, Lot, TransactionItem
 
 register = template.Library()
 
@@ -60,6 +65,7 @@ def format_table(header, body):
     )
 
 @register.simple_tag
+@instrumented('account_chart')
 def account_chart(
     accounts,
     fy,
@@ -75,6 +81,48 @@ def account_chart(
     if fy_template:
         fy_template = template.Template(fy_template)
 
+    dates = tuple(fy.end for fy in fyears)
+    pks = list(
+        accounts.values_list('pk', flat=True)
+        if isinstance(accounts, QuerySet) else
+        (acct.pk for acct in accounts)
+    )
+    tree = Account.get_tree().get_accounts()
+    if not tree.keys() >= set(pks):
+        tree = Account.get_tree(reload=True).get_accounts()
+    Account.load_balances(list(tree.values()), dates, children=True)
+    accounts = [tree[pk] for pk in pks]
+
+    def get_ancestors(acct):
+        ancs = []
+        while acct.parent_id:
+            acct = tree[acct.parent_id]
+            ancs.append(acct)
+        return ancs
+
+    account_lots = {}
+    if lots:
+        if ledger.is_enabled():
+            lot_balances = ledger.Ledger.load().get_lot_balances(
+                dates + (None,)
+            )
+        else:
+            lot_balances = {
+                lot: balances['own'] for (__, lot), balances in
+                TransactionItem.get_total_balances(
+                    dates + (None,),
+                    ('account', 'lot'),
+                    own=Q(lot__isnull=False)
+                ).items()
+            }
+        listed = {acct.pk for acct in accounts}
+        for lot in Lot.objects.filter(
+            pk__in=lot_balances, account__in=listed
+        ).select_related('fiscal_year'):
+            lot.account = tree[lot.account_id]
+            lot._balances = dict(zip(dates, lot_balances[lot.pk]))
+            account_lots.setdefault(lot.account_id, []).append(lot)
+
     stack = [{'children': []}]
     show = 0
     max_show = 1
@@ -112,14 +160,13 @@ def account_chart(
             first = acct
 
         append(acct)
-        if lots:
-            for lot in acct.get_lots():
-                append(lot)
-                flush()
+        for lot in account_lots.get(acct.pk, ()):
+            append(lot)
+            flush()
 
-        ancs = list((next_acct or first).get_ancestors())
+        ancs = get_ancestors(next_acct or first)
         if not next_acct:
-            for anc in acct.get_ancestors(ascending=True):
+            for anc in get_ancestors(acct):
                 if anc in ancs:
                     ancs.remove(anc)
                     break
@@ -127,7 +174,7 @@ def account_chart(
         while stack[-1]['account'] not in ancs:
             acc = flush()
             if len(stack) == 1:
-                parent = acc.parent
+                parent = tree.get(acc.parent_id)
                 if not parent or parent in ancs:
                     break
                 append(parent, True)
@@ -247,10 +294,59 @@ def account_chart(
     )
 
 @register.simple_tag
+@instrumented('account_change_table')
 def account_change_table(fy, accounts):
+    accounts = list(accounts)
     header = [''] + [acct.name for acct in accounts]
     rows = []
 
+    dates = (fy.start - timedelta(days=1), fy.end)
+    if any(
+            (date, True) not in getattr(acct, '_balances', {})
+            for acct in accounts for date in dates
+    ):
+        Account.load_balances(accounts, dates, children=True)
+
+    def get_columns(tree_id, lft):
+        return [
+            i for i, acct in enumerate(accounts)
+            if acct.tree_id == tree_id and acct.lft <= lft <= acct.rght
+        ]
+
+    # The descriptions come with the sums, so that the transactions need
+    # not be fetched again by their ids
+    matrix = {}
+    descriptions = {}
+    if accounts:
+        for row in TransactionItem.objects.filter(
+            reduce(or_, (acct.get_subtree_filter() for acct in accounts)),
+            transaction__fiscal_year=fy,
+            transaction__state='C',
+            transaction__closing=False
+        ).values(
+            'transaction',
+            'transaction__description',
+            'account__tree_id',
+            'account__lft'
+        ).annotate(Sum('amount')).order_by():
+            descriptions[row['transaction']] = row['transaction__description']
+            balances = matrix.setdefault(
+                row['transaction'], [0] * len(accounts)
+            )
+            for i in get_columns(row['account__tree_id'], row['account__lft']):
+                balances[i] += TransactionItem.correct_sum(row['amount__sum'])
+
+    net_earnings = [0] * len(accounts)
+    pl = TransactionItem.get_total_balances(
+        (fy.end,), pl=Q(account__type__in=Account.TYPES_PL)
+    ).get((), {}).get('pl')
+    if pl:
+        for node in Account.get_tree().ordered:
+            if node.type != 'NE':
+                continue
+            for i in get_columns(node.tree_id, node.lft):
+                net_earnings[i] += pl[0]
+
     def render_dated_label(fmt, date):
         return fmt % {'date': date_format(date, 'SHORT_DATE_FORMAT')}
 
@@ -260,11 +356,7 @@ def account_change_table(fy, accounts):
     def append_row(title, balances):
         rows.append([title] + [render_balance(balance) for balance in balances])
 
-    def append_txn_row(txn, description):
-        balances = [
-            acct.get_balance(date=fy.end, children=True, transaction=txn)
-            for acct in accounts
-        ]
+    def append_txn_row(description, balances):
         if any(balances):
             append_row(description, balances)
 
@@ -273,10 +365,10 @@ def account_change_table(fy, accounts):
         [opening_balance(acct, fy, children=True) for acct in accounts]
     )
 
-    for txn in fy.transactions.filter(closing=False):
-        append_txn_row(txn, txn.description)
+    for txn, balances in sorted(matrix.items()):
+        append_txn_row(descriptions[txn], balances)
 
-    append_txn_row('closing', _('Net earnings'))
+    append_txn_row(_('Net earnings'), net_earnings)
 
     append_row(
         render_dated_label(_('Closing balance on %(date)s'), fy.end),
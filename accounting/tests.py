@@ -0,0 +1,1072 @@
+# Copyright (c) 2026 Data King Ltd
+# See LICENSE file for license details
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.transaction import atomic
+from django.template import Context, Template
+from django.urls import reverse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+import collections
+import datetime
+from decimal import Decimal as D
+import os
+import re
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from . import forms, instrumentation, ledger, views
+from .models import *
+
+
+class LedgerMixin:
+
+    def setUp(self):
+        DateRange.invalidate_calendars()
+        Account.invalidate_tree()
+        ledger.Ledger.invalidate()
+
+        self.journal = Journal.objects.create(code='C', description='Cash')
+        Journal.objects.create(code='X', description='Closing', closing=True)
+
+        def create(name, code, type, parent=None, lot_tracking=False):
+            return Account.objects.create(
+                name=name,
+                code=code,
+                parent=parent,
+                type=type,
+                public=True,
+                frozen=parent is None,
+                lot_tracking=lot_tracking
+            )
+
+        assets = create('Assets', '', 'As')
+        equity = create('Equity', '', 'Eq')
+        pl = create('Profit and loss', '', 'In')
+        self.cash = create('Cash', '1100', 'As', assets)
+        self.stock = create('Stock', '1200', 'As', assets, True)
+        self.capital = create('Capital', '3100', 'Eq', equity)
+        self.earnings = create('Net earnings', '3999', 'NE', equity)
+        self.sales = create('Sales', '4100', 'In', pl)
+        self.costs = create('Costs', '5100', 'Ex', pl)
+
+    def post(self, date, *amounts, journal=None):
+        return Transaction.objects.post_many((
+            (
+                Transaction(journal=journal or self.journal, date=date),
+                [
+                    TransactionItem(account=account, amount=D(amount))
+                    for account, amount in amounts
+                ]
+            ),
+        ))[0]
+
+    def assertBalances(self, date):
+        """
+        Compares the balances of all accounts with plain sums of the
+        committed transaction items.
+        """
+        for account in Account.objects.all():
+            for children in (False, True):
+                items = TransactionItem.objects.filter(
+                    account.get_subtree_filter() if children else
+                    models.Q(account=account)
+                )
+                expected = TransactionItem.get_total_balance(items, date)
+                if children and Account.objects.filter(
+                        account.get_subtree_filter(''), type='NE'
+                ).exists():
+                    expected += TransactionItem.get_total_balance(
+                        TransactionItem.objects.filter(
+                            account__type__in=Account.TYPES_PL
+                        ),
+                        date
+                    )
+                self.assertEqual(
+                    account.get_balance(date=date, children=children),
+                    expected,
+                    f'{account} on {date}'
+                )
+
+
+class LedgerTestCase(LedgerMixin, TestCase):
+
+    def bump(self, name):
+        """
+        Bumps the version of a process-wide cache, as another process
+        changing its data would.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            CacheVersion.bump(name)
+        ProcessCache.reset_checks()
+
+
+class ClosingBalanceTest(LedgerTestCase):
+
+    def test_close_after_next_year_postings(self):
+        self.post(
+            datetime.date(2025, 6, 1), (self.cash, -100), (self.sales, 100)
+        )
+        self.post(
+            datetime.date(2026, 1, 1), (self.cash, -40), (self.capital, 40)
+        )
+        self.post(
+            datetime.date(2026, 2, 1), (self.cash, 15), (self.costs, -15)
+        )
+
+        FiscalYear.by_date(datetime.date(2025, 12, 31)).close()
+        self.assertTrue(ClosingBalance.objects.exists())
+
+        for date in (
+                datetime.date(2025, 12, 31),
+                datetime.date(2026, 1, 1),
+                datetime.date(2026, 3, 3),
+                None
+        ):
+            self.assertBalances(date)
+
+
+class PostManyTest(LedgerTestCase):
+
+    def test_unknown_account(self):
+        with self.assertRaisesMessage(ValidationError, 'Unknown account'):
+            Transaction.objects.post_many((
+                (
+                    Transaction(journal=self.journal),
+                    [
+                        TransactionItem(account_id=999999, amount=D(1)),
+                        TransactionItem(account=self.cash, amount=D(-1))
+                    ]
+                ),
+            ))
+
+    def test_unknown_lot(self):
+        with self.assertRaisesMessage(ValidationError, 'Unknown lot'):
+            Transaction.objects.post_many((
+                (
+                    Transaction(journal=self.journal),
+                    [
+                        TransactionItem(
+                            account=self.stock, lot_id=999999, amount=D(1)
+                        ),
+                        TransactionItem(account=self.cash, amount=D(-1))
+                    ]
+                ),
+            ))
+
+    def test_balance_rows_without_lot(self):
+        date = datetime.date(2025, 6, 1)
+        self.post(date, (self.cash, -10), (self.sales, 10))
+        period = FiscalPeriod.by_date(date)
+
+        AccountPeriodBalance.objects.bulk_create(
+            [AccountPeriodBalance(account=self.cash, period=period)],
+            ignore_conflicts=True
+        )
+        AccountDailyBalance.objects.bulk_create(
+            [AccountDailyBalance(account=self.cash, period=period, date=date)],
+            ignore_conflicts=True
+        )
+        self.post(date, (self.cash, -5), (self.sales, 5))
+
+        for model in (AccountPeriodBalance, AccountDailyBalance):
+            self.assertEqual(
+                model.objects.filter(account=self.cash).values_list(
+                    'net', flat=True
+                ).get(),
+                -15
+            )
+
+    def test_without_bulk_insert_returning(self):
+        with mock.patch.object(
+                type(connection.features),
+                'can_return_rows_from_bulk_insert',
+                False
+        ):
+            txn = self.post(
+                datetime.date(2025, 6, 1), (self.stock, 5), (self.cash, -5)
+            )
+            bank, = Account.objects.bulk_import(
+                [
+                    Account(
+                        name='Bank',
+                        code='1150',
+                        parent=self.cash.parent,
+                        type='As',
+                        public=True,
+                        frozen=False,
+                        lot_tracking=False
+                    )
+                ]
+            )
+
+        self.assertEqual(txn.number, 1)
+        self.assertEqual(
+            txn.items.get(account=self.stock).lot.get_balance(), 5
+        )
+        self.assertEqual(bank.parent, self.cash.parent)
+        self.assertBalances(None)
+
+
+class LotSearchTest(LedgerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        date = datetime.date(2025, 6, 1)
+        self.lots = [
+            self.post(
+                date, (self.stock, amount), (self.cash, -amount)
+            ).items.get(account=self.stock).lot
+            for amount in (10, 20, 30)
+        ]
+        self.settled = Transaction.objects.post_many((
+            (
+                Transaction(journal=self.journal, date=date),
+                [
+                    TransactionItem(
+                        account=self.stock, lot=self.lots[0], amount=D(-10)
+                    ),
+                    TransactionItem(account=self.cash, amount=D(10))
+                ]
+            ),
+        ))[0].items.get(account=self.stock)
+        self.url = reverse('accounting:lot_search', args=(self.stock.pk,))
+
+    def search(self, q=''):
+        return [
+            result['id']
+            for result in self.client.get(self.url, {'q': q}).json()['results']
+        ]
+
+    def test_open_lots(self):
+        self.assertEqual(self.search(), [self.lots[2].pk, self.lots[1].pk])
+        self.assertEqual(
+            self.search(f'2025/{self.lots[1].number}'), [self.lots[1].pk]
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse('accounting:lot_search', args=(self.cash.pk,))
+            ).status_code,
+            404
+        )
+
+    def test_limit(self):
+        with mock.patch.object(views.LotSearchView, 'limit', 1), \
+             CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search(), [self.lots[2].pk])
+        self.assertTrue(
+            queries.captured_queries[-1]['sql'].endswith('LIMIT 1')
+        )
+
+    def test_form(self):
+        html = forms.TransactionItemForm(instance=self.settled).as_p()
+        self.assertIn(f'value="{self.lots[0].pk}" selected', html)
+        self.assertNotIn(f'value="{self.lots[1].pk}"', html)
+        self.assertIn(f'data-accounts="{self.stock.pk}"', html)
+
+        form = forms.TransactionItemForm(
+            {'target': self.cash.pk, 'lot': self.lots[1].pk, 'debit': '5'},
+            instance=TransactionItem(transaction=self.settled.transaction)
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('lot', str(form.errors).lower())
+
+
+class GeneralLedgerExportTest(LedgerTestCase):
+
+    def test_opening_balances(self):
+        self.post(
+            datetime.date(2025, 6, 1), (self.cash, -100), (self.sales, 100)
+        )
+        self.post(
+            datetime.date(2026, 2, 1), (self.cash, 15), (self.sales, -15)
+        )
+
+        rows = list(
+            views.GeneralLedgerExportView().get_rows(
+                FiscalYear.by_date(datetime.date(2026, 1, 1)), {}
+            )
+        )
+        opening = {
+            row['account']: row['balance'] for row in rows
+            if row['date'] == '2026-01-01'
+        }
+        self.assertEqual(opening, {'1100': '100.00', '4100': '0'})
+        self.assertEqual(rows[-1]['account'], '4100')
+        self.assertEqual(rows[-1]['balance'], '-15.00')
+
+
+class AccountChangeTableTest(LedgerTestCase):
+
+    def add_transactions(self, count):
+        for i in range(count):
+            Transaction.objects.post_many((
+                (
+                    Transaction(
+                        journal=self.journal,
+                        date=datetime.date(2025, 2, 1),
+                        description=f'Investment {i}'
+                    ),
+                    [
+                        TransactionItem(account=self.cash, amount=D(-10)),
+                        TransactionItem(account=self.capital, amount=D(10))
+                    ]
+                ),
+            ))
+
+    def render(self):
+        return Template(
+            '{% load accounting %}{% account_change_table fy accounts %}'
+        ).render(
+            Context(
+                {
+                    'accounts': [self.capital, self.earnings],
+                    'fy': FiscalYear.by_date(datetime.date(2025, 1, 1))
+                }
+            )
+        )
+
+    def test_transaction_rows(self):
+        self.add_transactions(3)
+        self.render()
+        with CaptureQueriesContext(connection) as queries:
+            html = self.render()
+        self.assertEqual(
+            re.findall('Investment [0-9]+', html),
+            ['Investment 0', 'Investment 1', 'Investment 2']
+        )
+
+        # Neither the number of queries nor their parameters grow with the
+        # number of transactions
+        self.add_transactions(30)
+        with CaptureQueriesContext(connection) as more_queries:
+            html = self.render()
+        self.assertEqual(len(re.findall('Investment [0-9]+', html)), 33)
+        self.assertEqual(
+            [len(query['sql']) for query in more_queries],
+            [len(query['sql']) for query in queries]
+        )
+
+
+class TouchTest(LedgerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        FiscalYear.by_date(datetime.date(2025, 1, 1))
+        FiscalYear.by_date(datetime.date(2026, 1, 1))
+
+    def get_versions(self):
+        return dict(FiscalYear.objects.values_list('start__year', 'version'))
+
+    def assertTouched(self, years, func):
+        before = self.get_versions()
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+        self.assertEqual(
+            {
+                year for year, version in self.get_versions().items()
+                if version > before[year]
+            },
+            set(years)
+        )
+
+    def test_lot_save(self):
+        lot = Lot(
+            account=self.stock,
+            fiscal_year=FiscalYear.by_date(datetime.date(2026, 1, 1))
+        )
+        self.assertTouched({2026}, lot.save)
+
+        lot.description = 'Widgets'
+        self.assertTouched({2026}, lot.save)
+
+    def test_account_delete(self):
+        self.assertTouched({2025, 2026}, self.costs.delete)
+
+    def test_stale_save(self):
+        fy = FiscalYear.by_date(datetime.date(2025, 1, 1))
+        versions = [self.get_versions()[2025]]
+        for day in range(1, 5):
+            self.assertTouched(
+                {2025, 2026},
+                lambda: self.post(
+                    datetime.date(2025, 6, day),
+                    (self.cash, -10),
+                    (self.sales, 10)
+                )
+            )
+            versions.append(self.get_versions()[2025])
+
+        self.assertTouched({2025, 2026}, fy.close)
+        versions.append(self.get_versions()[2025])
+        fy.properties = {'note': 'Audited'}
+        self.assertTouched({2025, 2026}, fy.save)
+        versions.append(self.get_versions()[2025])
+
+        self.assertEqual(versions, sorted(set(versions)))
+        fy.refresh_from_db()
+        self.assertTrue(fy.closed)
+        self.assertEqual(fy.properties, {'note': 'Audited'})
+
+
+class ConditionalTest(LedgerTestCase):
+
+    def get_etag(self):
+        view = views.ConditionalMixin()
+        view.get_conditional_response(
+            RequestFactory().get('/'),
+            FiscalYear.by_date(datetime.date(2025, 1, 1))
+        )
+        return view.etag
+
+    def test_commit(self):
+        url = reverse('accounting:general_ledger', args=('2025',))
+        fy = FiscalYear.by_date(datetime.date(2025, 6, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post(
+                datetime.date(2025, 6, 1), (self.cash, -10), (self.sales, 10)
+            )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etags = [response['ETag']]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.status_code, 304)
+
+        for day in range(2, 5):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post(
+                    datetime.date(2025, 6, day),
+                    (self.cash, -20),
+                    (self.sales, 20)
+                )
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[-1])
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(response['ETag'], etags)
+            etags.append(response['ETag'])
+
+        # Closing the stale instance must not bring back an earlier ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            fy.close()
+        for etag in etags:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(response['ETag'], etags)
+
+    def test_settings_salt(self):
+        etag = self.get_etag()
+        self.assertEqual(self.get_etag(), etag)
+        with self.settings(ACCOUNTING_COMPANY_NAME='Other, Inc.'):
+            self.assertNotEqual(self.get_etag(), etag)
+        with self.settings(ACCOUNTING_ETAG_SALT='1.1'):
+            self.assertNotEqual(self.get_etag(), etag)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Query plans of SQLite')
+class QueryPlanTest(LedgerTestCase):
+    """
+    Checks that the balance and report queries search the ledger tables by
+    their indexes, instead of scanning them.
+    """
+
+    tables = {
+        model._meta.db_table for model in (
+            Transaction,
+            TransactionItem,
+            AccountPeriodBalance,
+            AccountDailyBalance,
+            ClosingBalance
+        )
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.lot = Lot.objects.create(
+            account=self.stock,
+            fiscal_year=FiscalYear.by_date(datetime.date(2025, 1, 1))
+        )
+        self.post(
+            datetime.date(2025, 6, 1), (self.cash, -100), (self.sales, 100)
+        )
+        Transaction.objects.post_many((
+            (
+                Transaction(
+                    journal=self.journal, date=datetime.date(2025, 7, 1)
+                ),
+                [
+                    TransactionItem(
+                        account=self.stock, lot=self.lot, amount=D(5)
+                    ),
+                    TransactionItem(account=self.cash, amount=D(-5))
+                ]
+            ),
+        ))
+        FiscalYear.by_date(datetime.date(2025, 12, 31)).close()
+        self.post(
+            datetime.date(2026, 2, 1), (self.cash, 15), (self.costs, -15)
+        )
+
+    def assertIndexed(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        self.assertTrue(queries.captured_queries)
+
+        for query in queries.captured_queries:
+            sql = query['sql']
+
+            # Subqueries reuse aliases, and the plan lists their tables in
+            # the order of the subqueries
+            aliases = collections.defaultdict(list)
+            for table, alias in re.findall(r'"(\w+)" ([A-Z]\d+)\b', sql):
+                aliases[alias].append(table)
+
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                for __, __, __, detail in cursor.fetchall():
+                    words = detail.split()
+                    if words[0] not in ('SCAN', 'SEARCH'):
+                        continue
+                    table = aliases[words[1]].pop(0) \
+                        if aliases.get(words[1]) else words[1]
+                    if words[0] == 'SCAN':
+                        self.assertNotIn(table, self.tables, f'{detail}: {sql}')
+
+    def test_item_balances(self):
+        date = datetime.date(2026, 2, 10)
+        self.assertIndexed(
+            lambda: TransactionItem.get_total_balance(
+                self.cash.items.all(), date
+            )
+        )
+        self.assertIndexed(
+            lambda: TransactionItem.get_total_balance(
+                self.lot.items.all(), date
+            )
+        )
+
+    def test_balances(self):
+        for date in (
+                datetime.date(2025, 12, 31),
+                datetime.date(2026, 2, 10),
+                None
+        ):
+            self.assertIndexed(lambda: self.cash.get_balance(date=date))
+            self.assertIndexed(
+                lambda: self.cash.parent.get_balance(date=date, children=True)
+            )
+            self.assertIndexed(lambda: self.lot.get_balance(date=date))
+
+    def test_chart_balances(self):
+        self.assertIndexed(
+            lambda: list(
+                Account.objects.with_balances(
+                    (datetime.date(2025, 12, 31), datetime.date(2026, 2, 10)),
+                    True
+                )
+            )
+        )
+
+    def test_reports(self):
+        self.assertIndexed(lambda: list(self.stock.get_lots()))
+        self.assertIndexed(lambda: self.cash.period_totals)
+        self.assertIndexed(
+            lambda: Transaction.objects.filter(
+                fiscal_year=FiscalYear.by_date(datetime.date(2025, 1, 1)),
+                journal=self.journal,
+                number=1
+            ).exists()
+        )
+
+
+class GeneralLedgerViewTest(LedgerTestCase):
+
+    def add_transactions(self, count):
+        for i in range(count):
+            date = datetime.date(2025, 1 + i % 12, 1 + i % 28)
+            self.post(date, (self.cash, -10), (self.sales, 10))
+            self.post(date, (self.stock, 5), (self.costs, -5))
+
+    def get_ledger(self):
+        response = self.client.get(
+            reverse('accounting:general_ledger', args=('2025',))
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count(self):
+        # The first request loads the process-wide caches
+        self.add_transactions(12)
+        self.get_ledger()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_ledger()
+
+        self.add_transactions(48)
+        with self.assertNumQueries(len(queries)):
+            self.get_ledger()
+
+
+class InstrumentationTest(LedgerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.post(
+            datetime.date(2025, 6, 1), (self.cash, -10), (self.sales, 10)
+        )
+        self.measurements = []
+        instrumentation.measured.connect(self.receive)
+        self.addCleanup(instrumentation.measured.disconnect, self.receive)
+
+    def receive(self, sender, measurement, **kwargs):
+        self.measurements.append((sender, measurement))
+
+    def get_ledger(self):
+        response = self.client.get(
+            reverse('accounting:general_ledger', args=('2025',))
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def render_chart(self):
+        Template(
+            '{% load accounting %}{% account_chart accounts fy %}'
+        ).render(
+            Context(
+                {
+                    'accounts': Account.objects.all(),
+                    'fy': FiscalYear.by_date(datetime.date(2025, 1, 1))
+                }
+            )
+        )
+
+    def test_disabled(self):
+        for server_timing in (False, True):
+            with self.settings(
+                    ACCOUNTING_INSTRUMENTATION=False,
+                    ACCOUNTING_SERVER_TIMING=server_timing
+            ), mock.patch.object(
+                instrumentation, 'Measurement'
+            ) as measurement:
+                response = self.get_ledger()
+                self.render_chart()
+            self.assertNotIn('Server-Timing', response)
+            measurement.assert_not_called()
+        self.assertEqual(self.measurements, [])
+
+    def test_enabled(self):
+        with self.settings(
+                ACCOUNTING_INSTRUMENTATION=True,
+                ACCOUNTING_SERVER_TIMING=False
+        ):
+            response = self.get_ledger()
+            self.render_chart()
+        self.assertNotIn('Server-Timing', response)
+
+        self.assertEqual(
+            [sender for sender, __ in self.measurements],
+            ['GeneralLedgerView', 'account_chart']
+        )
+        for __, measurement in self.measurements:
+            self.assertGreater(measurement['queries'], 0)
+            self.assertGreater(measurement['seconds'], 0)
+            self.assertEqual(
+                len(measurement['slowest']), min(measurement['queries'], 5)
+            )
+            self.assertEqual(
+                measurement['slowest'], sorted(measurement['slowest'])[::-1]
+            )
+
+    def test_server_timing(self):
+        with self.settings(
+                ACCOUNTING_INSTRUMENTATION=True,
+                ACCOUNTING_SERVER_TIMING=True
+        ):
+            response = self.get_ledger()
+
+        (sender, measurement), = self.measurements
+        self.assertEqual(
+            response['Server-Timing'], measurement.get_server_timing()
+        )
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^GeneralLedgerView;dur=[0-9.]+, db;dur=[0-9.]+;'
+            rf'desc="{measurement["queries"]} queries"$'
+        )
+
+
+@unittest.skipIf(ledger.numpy is None, 'NumPy not installed')
+class ArchiveTest(LedgerTestCase):
+
+    def test_archived_segments(self):
+        for date in (
+                datetime.date(2025, 9, 1),
+                datetime.date(2025, 3, 1),
+                datetime.date(2026, 2, 1)
+        ):
+            self.post(date, (self.cash, -10), (self.sales, 10))
+            self.post(date, (self.stock, 5), (self.costs, -5))
+        fy = FiscalYear.by_date(datetime.date(2025, 1, 1))
+        fy.close()
+
+        dates = (
+            datetime.date(2025, 6, 30),
+            datetime.date(2025, 12, 31),
+            datetime.date(2026, 1, 1),
+            None
+        )
+        expected = ledger.Ledger().get_balances(dates, True)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                self.settings(ACCOUNTING_ARCHIVE_DIR=directory):
+            archive = ledger.ArchivedYear.write(directory, fy)
+            keys = list(archive.key)
+            self.assertEqual(keys, sorted(keys))
+
+            snapshot = ledger.Ledger()
+            self.assertEqual(len(snapshot.segments), 2)
+            for name in ledger.ArchivedYear.columns:
+                self.assertFalse(snapshot.segments[1][name].flags.owndata)
+            self.assertEqual(snapshot.get_balances(dates, True), expected)
+
+    def test_mismatching_archive(self):
+        for date in (datetime.date(2025, 3, 1), datetime.date(2026, 3, 1)):
+            self.post(date, (self.cash, -10), (self.sales, 10))
+        fy = FiscalYear.by_date(datetime.date(2025, 1, 1))
+        fy.close()
+        next_fy = FiscalYear.by_date(datetime.date(2026, 1, 1))
+        next_fy.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            ledger.ArchivedYear.write(directory, fy)
+            os.replace(
+                ledger.ArchivedYear.get_path(directory, fy),
+                ledger.ArchivedYear.get_path(directory, next_fy)
+            )
+            with self.assertRaisesMessage(ValueError, 'found for 2026'):
+                ledger.ArchivedYear.open_all(directory)
+
+
+@unittest.skipIf(ledger.numpy is None, 'NumPy not installed')
+class LedgerSnapshotTest(LedgerTestCase):
+
+    dates = (
+        datetime.date(2025, 3, 31),
+        datetime.date(2025, 12, 31),
+        datetime.date(2026, 2, 1),
+        None
+    )
+
+    def setUp(self):
+        super().setUp()
+        for date in (
+                datetime.date(2025, 2, 1),
+                datetime.date(2025, 7, 1),
+                datetime.date(2026, 2, 1)
+        ):
+            self.post(date, (self.cash, -10), (self.sales, 10))
+            self.post(date, (self.stock, 5), (self.costs, -5))
+            self.post(date, (self.cash, 3), (self.capital, -3))
+        FiscalYear.by_date(datetime.date(2025, 1, 1)).close()
+
+    def compute(self, snapshot):
+        """
+        Returns the balances and period totals of all accounts computed
+        one by one, in bulk and by the account_chart tag.
+        """
+        with self.settings(ACCOUNTING_LEDGER_SNAPSHOT=snapshot):
+            accounts = Account.objects.all()
+            return (
+                [
+                    account.get_balance(date=date, children=children)
+                    for account in accounts
+                    for date in self.dates
+                    for children in (False, True)
+                ],
+                [
+                    account.get_balance(date=date, children=True)
+                    for account in Account.objects.with_balances(
+                        self.dates, True
+                    )
+                    for date in self.dates
+                ],
+                [account.period_totals for account in accounts],
+                Template(
+                    '{% load accounting %}'
+                    '{% account_chart accounts fyears lots=True %}'
+                ).render(
+                    Context(
+                        {
+                            'accounts': accounts,
+                            'fyears': FiscalYear.objects.all()
+                        }
+                    )
+                )
+            )
+
+    def test_orm_comparison(self):
+        for snapshot, orm in zip(self.compute(True), self.compute(False)):
+            self.assertEqual(snapshot, orm)
+
+        with self.settings(ACCOUNTING_LEDGER_SNAPSHOT=True):
+            self.assertBalances(None)
+            self.assertBalances(datetime.date(2025, 12, 31))
+
+    def test_cached_balance(self):
+        with self.settings(ACCOUNTING_LEDGER_SNAPSHOT=True):
+            self.cash.get_balance()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.cash.get_balance(), -21)
+                self.assertEqual(
+                    self.cash.parent.get_balance(children=True), -6
+                )
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post(
+                    datetime.date(2026, 3, 1), (self.cash, -2), (self.sales, 2)
+                )
+            self.assertEqual(self.cash.get_balance(), -23)
+
+    def test_period_totals(self):
+        snapshot = ledger.Ledger()
+        debit, credit = snapshot.period_totals(True)
+        for row, pk in enumerate(snapshot.accounts):
+            self.assertEqual(
+                [
+                    (
+                        totals['period'].pk,
+                        int(totals['debit'] * 100),
+                        int(totals['credit'] * 100)
+                    )
+                    for totals in Account.objects.get(pk=pk).period_totals
+                ],
+                [
+                    (period, debit[row, column], credit[row, column])
+                    for column, period in enumerate(snapshot.periods)
+                    if debit[row, column] or credit[row, column]
+                ]
+            )
+
+
+class CalendarTest(LedgerTestCase):
+
+    def test_version_check(self):
+        fy = FiscalYear.by_date(datetime.date(2025, 6, 1))
+        period = FiscalPeriod.by_date(datetime.date(2025, 6, 1))
+        FiscalYear.get_calendar()
+        FiscalPeriod.get_calendar()
+        FiscalYear.objects.filter(pk=fy.pk).update(
+            end=datetime.date(2026, 6, 30)
+        )
+        FiscalPeriod.objects.filter(pk=period.pk).update(
+            end=datetime.date(2025, 6, 15)
+        )
+        self.assertEqual(
+            FiscalYear.by_date(datetime.date(2025, 6, 1)).end,
+            datetime.date(2025, 12, 31)
+        )
+
+        self.bump('calendar')
+        self.assertEqual(
+            FiscalYear.by_date(datetime.date(2025, 6, 1)).end,
+            datetime.date(2026, 6, 30)
+        )
+        self.assertEqual(
+            FiscalPeriod.by_date(datetime.date(2025, 6, 1)).end,
+            datetime.date(2025, 6, 15)
+        )
+        self.assertEqual(
+            FiscalPeriod.by_date(datetime.date(2025, 6, 1)).fiscal_year.end,
+            datetime.date(2026, 6, 30)
+        )
+
+
+class AccountTreeTest(LedgerTestCase):
+
+    def make_stale(self, tree):
+        """
+        Restores the given tree as the cached one, as if the accounts had
+        been changed by another process.
+        """
+        Account._tree.value = tree
+        Account._tree.version = tree.version
+
+    def test_version_check(self):
+        Account.get_tree()
+        Account.objects.filter(pk=self.cash.pk).update(name='Till')
+        self.assertEqual(Account.get_tree().nodes[self.cash.pk].name, 'Cash')
+
+        self.bump('accounts')
+        self.assertEqual(Account.get_tree().nodes[self.cash.pk].name, 'Till')
+
+    def test_account_chart_miss(self):
+        tree = Account.get_tree()
+        bank = Account.objects.create(
+            name='Bank',
+            code='1150',
+            parent=self.cash.parent,
+            type='As',
+            public=True,
+            frozen=False,
+            lot_tracking=False
+        )
+        self.make_stale(tree)
+        self.post(datetime.date(2025, 3, 1), (bank, 10), (self.capital, -10))
+
+        html = Template(
+            '{% load accounting %}{% account_chart accounts fy %}'
+        ).render(
+            Context(
+                {
+                    'accounts': Account.objects.all(),
+                    'fy': FiscalYear.by_date(datetime.date(2025, 3, 1))
+                }
+            )
+        )
+        self.assertIn('1150 Bank', html)
+
+    @unittest.skipIf(ledger.numpy is None, 'NumPy not installed')
+    def test_ledger_miss(self):
+        tree = Account.get_tree()
+        bank = Account.objects.create(
+            name='Bank',
+            code='1150',
+            parent=self.cash.parent,
+            type='As',
+            public=True,
+            frozen=False,
+            lot_tracking=False
+        )
+        self.make_stale(tree)
+        self.post(datetime.date(2025, 3, 1), (bank, 10), (self.capital, -10))
+
+        balances = ledger.Ledger().get_balances((None,), True)
+        self.assertEqual(balances[bank.pk], [10])
+        self.assertEqual(balances[self.cash.parent.pk], [10])
+
+
+class ConcurrencyTest(LedgerMixin, TransactionTestCase):
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Threads cannot share an in-memory SQLite database')
+        super().setUp()
+
+    def run_threads(self, func, count=8):
+        """
+        Calls func with the index of each of count threads, released at
+        once, and returns the results in thread order.
+        """
+        barrier = threading.Barrier(count)
+        results = [None] * count
+        errors = []
+
+        def run(i):
+            try:
+                barrier.wait()
+                results[i] = func(i)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=run, args=(i,)) for i in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+
+    def test_sequence_reserve(self):
+        fy = FiscalYear.by_date(datetime.date(2025, 1, 1))
+
+        def reserve(i):
+            with atomic():
+                return [
+                    JournalSequence.reserve(
+                        count=3, journal=self.journal, fiscal_year=fy
+                    )
+                    for __ in range(5)
+                ]
+
+        numbers = sorted(
+            number for firsts in self.run_threads(reserve)
+            for first in firsts for number in range(first, first + 3)
+        )
+        self.assertEqual(numbers, list(range(1, 8 * 5 * 3 + 1)))
+        self.assertEqual(
+            JournalSequence.objects.get(journal=self.journal).last,
+            len(numbers)
+        )
+
+    def test_commits(self):
+        date = datetime.date(2025, 3, 1)
+        FiscalPeriod.by_date(date)
+        drafts = []
+        for i in range(8 * 5):
+            txn = Transaction.objects.create(journal=self.journal, date=date)
+            TransactionItem.objects.create(
+                transaction=txn, account=self.stock, amount=D(1)
+            )
+            TransactionItem.objects.create(
+                transaction=txn, account=self.cash, amount=D(-1)
+            )
+            drafts.append(txn)
+
+        def commit(i):
+            for txn in drafts[i * 5:i * 5 + 5]:
+                txn.commit()
+
+        self.run_threads(commit)
+        self.assertEqual(
+            sorted(
+                Transaction.objects.filter(state='C').values_list(
+                    'number', flat=True
+                )
+            ),
+            list(range(1, 8 * 5 + 1))
+        )
+        self.assertEqual(self.stock.lots.count(), 8 * 5)
+        self.assertBalances(date)
+
+    def test_first_postings(self):
+        date = datetime.date(2025, 3, 1)
+        lot = Lot.objects.create(
+            account=self.stock, fiscal_year=FiscalYear.by_date(date)
+        )
+        FiscalPeriod.by_date(date)
+        journals = [
+            Journal.objects.create(code=f'J{i}', description=f'Journal {i}')
+            for i in range(8)
+        ]
+
+        # Each thread posts to its own journal, so that the postings are
+        # not serialized by the journal sequence
+        self.run_threads(
+            lambda i: Transaction.objects.post_many((
+                (
+                    Transaction(journal=journals[i], date=date),
+                    [
+                        TransactionItem(
+                            account=self.stock, lot=lot, amount=D(1)
+                        ),
+                        TransactionItem(account=self.cash, amount=D(-1))
+                    ]
+                ),
+            ))
+        )
+
+        for model in (AccountPeriodBalance, AccountDailyBalance):
+            self.assertEqual(
+                model.objects.filter(account=self.stock, lot=lot).aggregate(
+                    models.Sum('net')
+                )['net__sum'],
+                8
+            )
+        self.assertBalances(date)
@@ -1,4 +1,4 @@
-# Copyright (c) 2015-2023 Data King Ltd
+# Copyright (c) 2015-2026 Data King Ltd
 # See LICENSE file for license details
 
 from django.urls import path
@@ -43,10 +43,26 @@ urlpatterns = (
         GeneralLedgerView.as_view(),
         name='general_ledger'
     ),
+    path(
+        'general-ledger/<str:fy>/<str:format>',
+        GeneralLedgerExportView.as_view(),
+        name='general_ledger_export'
+    ),
     path(
         'general-journal/<str:fy>',
         JournalView.as_view(),
         name='general_journal'
     ),
-    path('journal/<str:fy>/<str:code>', JournalView.as_view(), name='journal')
+    path(
+        'general-journal/<str:fy>/<str:format>',
+        JournalExportView.as_view(),
+        name='general_journal_export'
+    ),
+    path('journal/<str:fy>/<str:code>', JournalView.as_view(), name='journal'),
+    path(
+        'journal/<str:fy>/<str:code>/<str:format>',
+        JournalExportView.as_view(),
+        name='journal_export'
+    ),
+    path('lots/<int:account>', LotSearchView.as_view(), name='lot_search')
 )
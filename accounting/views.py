@@ -1,39 +1,135 @@
-# Copyright (c) 2015-2024 Data King Ltd
+# Copyright (c) 2015-2026 Data King Ltd
 # See LICENSE file for license details
 
 from django.conf import settings
-from django.db.models import Max, Min
-from django.http import Http404
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db.models import Max, Min, Q
+from django.http import (
+    Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+)
 from django.shortcuts import get_object_or_404
-from django.utils.translation import gettext as _
-from django.views.generic import TemplateView
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.translation import get_language, gettext as _
+from django.views.generic import TemplateView, View
 
-from datetime import date
+import csv
+from datetime import timedelta
+import hashlib
+import itertools
+import json
 
+from . import instrumentation
 from .models import *
 
 
-class ReportView(TemplateView):
+def get_fiscal_year(fy):
+    try:
+        return FiscalYear.by_label(fy)
+    except (ValueError, FiscalYear.DoesNotExist):
+        raise Http404
+
+
+class ConditionalMixin:
+    """
+    Validates conditional requests against the version of the fiscal year,
+    so that unchanged reports are answered before any of their data is
+    loaded.
+    """
+
+    @staticmethod
+    def get_salt():
+        """
+        Returns a hash of the settings that change the rendered reports, so
+        that changing them, or ACCOUNTING_ETAG_SALT on a deploy, invalidates
+        the ETags and the cached reports.
+        """
+        return hashlib.sha1(
+            repr(
+                (
+                    getattr(settings, 'ACCOUNTING_ETAG_SALT', None),
+                    getattr(settings, 'ACCOUNTING_COMPANY_NAME', None),
+                    settings.TEMPLATES
+                )
+            ).encode()
+        ).hexdigest()[:8]
+
+    def get_conditional_response(self, request, fy):
+        self.version, modified = FiscalYear.objects.values_list(
+            'version', 'modified'
+        ).get(pk=fy.pk)
+        self.salt = self.get_salt()
+        self.etag = f'"{fy.pk}-{self.version}-{get_language()}-{self.salt}"'
+        self.last_modified = int(modified.timestamp()) if modified else None
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.last_modified
+        )
+        return response and self.set_conditional_headers(response)
+
+    def set_conditional_headers(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified:
+            response['Last-Modified'] = http_date(self.last_modified)
+        return response
+
+
+class ReportView(ConditionalMixin, TemplateView):
+    def dispatch(self, request, *args, **kwargs):
+        with instrumentation.measure(type(self).__name__) as measurement:
+            response = super().dispatch(request, *args, **kwargs)
+            if measurement is None:
+                return response
+            if not getattr(response, 'is_rendered', True):
+                response.render()
+
+        if getattr(settings, 'ACCOUNTING_SERVER_TIMING', False):
+            response['Server-Timing'] = measurement.get_server_timing()
+        return response
+
+    def get(self, request, *args, **kwargs):
+        fy = get_fiscal_year(kwargs['fy'])
+        response = self.get_conditional_response(request, fy)
+        if response:
+            return response
+
+        alias = getattr(settings, 'ACCOUNTING_REPORT_CACHE', None)
+        if not alias:
+            return self.set_conditional_headers(
+                super().get(request, *args, **kwargs)
+            )
+
+        key = 'accounting:{}:{}:{}:{}:{}'.format(
+            type(self).__name__,
+            request.path,
+            get_language(),
+            self.version,
+            self.salt
+        )
+
+        cache = caches[alias]
+        cached = cache.get(key)
+        if cached:
+            content, content_type = cached
+            return self.set_conditional_headers(
+                HttpResponse(content, content_type=content_type)
+            )
+
+        response = super().get(request, *args, **kwargs)
+        response.add_post_render_callback(
+            lambda response: cache.set(
+                key,
+                (response.content, response['Content-Type']),
+                getattr(
+                    settings, 'ACCOUNTING_REPORT_CACHE_TIMEOUT', DEFAULT_TIMEOUT
+                )
+            )
+        )
+        return self.set_conditional_headers(response)
+
     def get_context_data(self, **kwargs):
         res = super().get_context_data(**kwargs)
-        fy = kwargs['fy']
-
-        try:
-            y = int(fy)
-            i = 0
-        except ValueError:
-            try:
-                y = int(fy[:-1])
-                i = ord(fy[-1]) - 64
-            except ValueError:
-                raise Http404
-
-        try:
-            fy = FiscalYear.objects.filter(
-                end__gte=date(y, 1, 1), end__lte=date(y, 12, 31)
-            ).order_by('end')[i]
-        except IndexError:
-            raise Http404
+        fy = get_fiscal_year(kwargs['fy'])
 
         res['company_name'] = getattr(settings, 'ACCOUNTING_COMPANY_NAME', None)
         res['title'] = self.title
@@ -46,8 +142,14 @@ class ReportView(TemplateView):
 class AccountView(ReportView):
     accounts = Account.objects
 
+    def get_balance_dates(self, context):
+        fy = context['fy']
+        return (fy.start - timedelta(days=1), fy.end)
+
     def update_context(self, context, args):
-        context['accounts'] = self.accounts.all()
+        context['accounts'] = self.accounts.with_balances(
+            self.get_balance_dates(context), children=True
+        )
 
 class EquityChangeStatementView(AccountView):
     title = _('Statement of Changes in Equity')
@@ -71,13 +173,35 @@ class GeneralLedgerView(AccountView):
     title = _('General Ledger')
     template_name = 'accounting/general_ledger.html'
 
+    def update_context(self, context, args):
+        super().update_context(context, args)
+
+        transactions = {}
+        for txn in Transaction.objects.filter(
+            fiscal_year=context['fy'], state='C', closing=False
+        ).with_items():
+            for item in txn.items.all():
+                txns = transactions.setdefault(item.account_id, [])
+                if not txns or txns[-1] is not txn:
+                    txns.append(txn)
+
+        context['ledger'] = [
+            (account, transactions.get(account.pk, ()))
+            for account in context['accounts']
+        ]
+
 
 class AnnualReportView(AccountView):
+    def get_balance_dates(self, context):
+        return super().get_balance_dates(context) + tuple(
+            fy.end for fy in context['fiscal_years']
+        )
+
     def update_context(self, context, args):
-        super().update_context(context, args)
         context['fiscal_years'] = FiscalYear.objects.filter(
             end__lte=context['fy'].end
         ).order_by('-end')
+        super().update_context(context, args)
 
 class FinancialStatementView(AnnualReportView):
     title = _('Financial Statement')
@@ -87,7 +211,9 @@ class FinancialStatementView(AnnualReportView):
         super().update_context(context, args)
         for group in ('balance', 'pl', 'equity'):
             attr = f'{group}_accounts'
-            context[attr] = getattr(Account, attr).filter(public=True)
+            context[attr] = getattr(Account, attr).filter(
+                public=True
+            ).with_balances(self.get_balance_dates(context), children=True)
         context['journals'] = Journal.objects.filter(
             transaction__fiscal_year=context['fy']
         ).values('code', 'description').annotate(
@@ -119,4 +245,227 @@ class JournalView(ReportView):
             context['title'] = journal.description or journal.code
             txn_filter['journal'] = journal
 
-        context['transactions'] = Transaction.objects.filter(**txn_filter)
+        context['transactions'] = Transaction.objects.filter(
+            **txn_filter
+        ).with_items()
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class ExportView(ConditionalMixin, View):
+    chunk_size = 2000
+    formats = {
+        'csv': 'text/csv',
+        'jsonl': 'application/x-ndjson'
+    }
+
+    def get(self, request, fy, format, **kwargs):
+        if format not in self.formats:
+            raise Http404
+
+        fy = get_fiscal_year(fy)
+        response = self.get_conditional_response(request, fy)
+        if response:
+            return response
+
+        rows = self.get_rows(fy, kwargs)
+
+        if format == 'csv':
+            writer = csv.writer(Echo())
+            content = itertools.chain(
+                (writer.writerow(self.columns),),
+                (
+                    writer.writerow(row.get(col, '') for col in self.columns)
+                    for row in rows
+                )
+            )
+        else:
+            content = (json.dumps(row) + '\n' for row in rows)
+
+        response = StreamingHttpResponse(
+            content, content_type=self.formats[format]
+        )
+        response['Content-Disposition'] = \
+            f'attachment; filename="{self.name}-{fy}.{format}"'
+        return self.set_conditional_headers(response)
+
+    @staticmethod
+    def get_lot_labels():
+        fyears = {fy.pk: str(fy) for fy in FiscalYear.objects.all()}
+
+        def label(row):
+            return f'{fyears[row["lot__fiscal_year"]]}/{row["lot__number"]}' \
+                if row['lot'] else ''
+        return label
+
+    @staticmethod
+    def format_amount(amount):
+        return str(TransactionItem.correct_sum(amount))
+
+    def get_item_row(self, row, lot_label):
+        amount = row['amount']
+        return {
+            'date': row['transaction__date'].isoformat(),
+            'journal': row['transaction__journal__code'],
+            'number': row['transaction__number'],
+            'transaction': row['transaction__description'],
+            'account': row['account__code'],
+            'account_name': row['account__name'],
+            'lot': lot_label(row),
+            'description': row['description'],
+            'debit': self.format_amount(-amount) if amount < 0 else '',
+            'credit': self.format_amount(amount) if amount > 0 else ''
+        }
+
+    def get_items(self, **filters):
+        return TransactionItem.objects.filter(
+            transaction__state='C', **filters
+        ).values(
+            'account',
+            'account__code',
+            'account__name',
+            'amount',
+            'description',
+            'lot',
+            'lot__fiscal_year',
+            'lot__number',
+            'transaction__date',
+            'transaction__description',
+            'transaction__journal__code',
+            'transaction__number'
+        )
+
+
+class GeneralLedgerExportView(ExportView):
+    name = 'general-ledger'
+    columns = (
+        'account',
+        'account_name',
+        'date',
+        'journal',
+        'number',
+        'transaction',
+        'description',
+        'lot',
+        'debit',
+        'credit',
+        'balance'
+    )
+
+    def get_rows(self, fy, args):
+        opening = fy.start - timedelta(days=1)
+        accounts = list(Account.objects.with_balances((opening,)))
+        lot_label = self.get_lot_labels()
+
+        items = self.get_items(
+            transaction__fiscal_year=fy, transaction__closing=False
+        ).order_by(
+            'account__tree_id',
+            'account__lft',
+            'transaction__date',
+            'transaction__journal__code',
+            'transaction__number',
+            'transaction__id',
+            'id'
+        ).iterator(chunk_size=self.chunk_size)
+        item = next(items, None)
+
+        for account in accounts:
+            balance = 0 if account.is_pl_account else \
+                account.get_balance(date=opening)
+            if not balance and (not item or item['account'] != account.pk):
+                continue
+
+            yield {
+                'account': account.code,
+                'account_name': account.name,
+                'date': fy.start.isoformat(),
+                'transaction': _('Opening balance'),
+                'balance': self.format_amount(balance * account.sign)
+            }
+
+            while item and item['account'] == account.pk:
+                balance += item['amount']
+                row = self.get_item_row(item, lot_label)
+                row['balance'] = self.format_amount(balance * account.sign)
+                yield row
+                item = next(items, None)
+
+
+class JournalExportView(ExportView):
+    name = 'journal'
+    columns = (
+        'date',
+        'journal',
+        'number',
+        'transaction',
+        'account',
+        'account_name',
+        'lot',
+        'description',
+        'debit',
+        'credit'
+    )
+
+    def get_rows(self, fy, args):
+        filters = {'transaction__fiscal_year': fy}
+        if 'code' in args:
+            filters['transaction__journal'] = get_object_or_404(
+                Journal, code=args['code']
+            )
+
+        lot_label = self.get_lot_labels()
+        for item in self.get_items(**filters).order_by(
+            'transaction__date',
+            'transaction__journal__code',
+            'transaction__number',
+            'transaction__id',
+            'id'
+        ).iterator(chunk_size=self.chunk_size):
+            yield self.get_item_row(item, lot_label)
+
+
+class LotSearchView(View):
+    limit = 20
+
+    def get(self, request, account):
+        account = get_object_or_404(
+            Account, pk=account, frozen=False, lot_tracking=True
+        )
+        lots = Lot.objects.filter(account=account).with_balances()
+
+        for term in request.GET.get('q', '').split():
+            q = Q(description__icontains=term)
+            fy, __, number = term.rpartition('/')
+            if number.isdigit():
+                if not fy:
+                    q |= Q(number=number)
+                else:
+                    try:
+                        q |= Q(
+                            fiscal_year=FiscalYear.by_label(fy), number=number
+                        )
+                    except (ValueError, FiscalYear.DoesNotExist):
+                        pass
+            lots = lots.filter(q)
+
+        # Only the open lots are offered, the latest first, and the limit is
+        # applied in the query so that the balances of the other lots are
+        # not loaded
+        lots = lots.filter(committed_balance__isnull=False).exclude(
+            committed_balance=0
+        ).order_by('-fiscal_year__start', '-number')[:self.limit]
+        return JsonResponse(
+            {
+                'results': [
+                    {
+                        'id': lot.pk,
+                        'text': f'{lot} ({lot.get_balance_display()})'
+                    }
+                    for lot in lots
+                ]
+            }
+        )
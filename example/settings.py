@@ -78,6 +78,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {
+            # A file, so that the concurrency tests can share it with threads
+            'NAME': BASE_DIR / 'test.sqlite3',
+        },
     }
 }
 